@@ -0,0 +1,303 @@
+# image_index.py
+
+import io
+import os
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from PIL import Image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+THUMBNAIL_SIZE = (32, 32)
+HIST_LEVELS = 4               # level per channel RGB -> 4*4*4 = 64 bin warna
+GRAY_GRID = (8, 8)            # layout grayscale -> 64 nilai
+VECTOR_DIM = HIST_LEVELS ** 3 + GRAY_GRID[0] * GRAY_GRID[1]
+# Duplikat = dHash dekat DAN vektor fitur hampir identik; dHash saja terlalu kasar untuk
+# foto produk berlatar putih (banyak produk berbeda berbagi dHash yang sama)
+DUPLICATE_MAX_HAMMING = int(os.getenv("IMAGE_DUPLICATE_MAX_HAMMING", "4"))
+DUPLICATE_MIN_COSINE = float(os.getenv("IMAGE_DUPLICATE_MIN_COSINE", "0.98"))
+
+# Jumlah bit 1 untuk tiap nilai byte, untuk jarak Hamming vektor
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def _dhash(gray):
+    """Difference hash 64-bit dari gambar grayscale (9x8)"""
+    pixels = np.asarray(gray.resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int(np.packbits(bits).view('>i8')[0])
+
+def _feature_vector(rgb):
+    """Histogram warna (akar, Hellinger) + layout grayscale, dinormalisasi L2 -> cosine = dot product"""
+    pixels = np.asarray(rgb, dtype=np.uint8).reshape(-1, 3) // (256 // HIST_LEVELS)
+    bins = (pixels[:, 0].astype(np.int64) * HIST_LEVELS + pixels[:, 1]) * HIST_LEVELS + pixels[:, 2]
+    hist = np.sqrt(np.bincount(bins, minlength=HIST_LEVELS ** 3) / len(bins))
+
+    layout = np.asarray(rgb.convert('L').resize(GRAY_GRID, Image.BILINEAR), dtype=np.float32).ravel()
+    layout = layout - layout.mean()
+    layout_norm = np.linalg.norm(layout)
+    layout = layout / layout_norm if layout_norm > 0 else layout
+
+    vector = np.concatenate([hist / max(np.linalg.norm(hist), 1e-12), layout]).astype(np.float32)
+    return vector / max(np.linalg.norm(vector), 1e-12)
+
+def fingerprint_file(args):
+    """Decode satu gambar dan hitung fingerprint-nya. Dipanggil di worker process pool."""
+    file_path, image_key = args
+    try:
+        with open(file_path, 'rb') as f:
+            source_mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+            data = f.read()
+        img = Image.open(io.BytesIO(data))
+        width, height = img.size
+        img.draft('RGB', THUMBNAIL_SIZE)  # JPEG: decode langsung di skala kecil (DCT scaling)
+        rgb = img.convert('RGB').resize(THUMBNAIL_SIZE, Image.BILINEAR)
+        return {
+            "image_key": image_key,
+            "category": image_key.split('/')[-2] if image_key.count('/') >= 1 else None,
+            "md5": hashlib.md5(data).hexdigest(),
+            "dhash": _dhash(rgb.convert('L')),
+            "feature_vector": _feature_vector(rgb),
+            "width": width,
+            "height": height,
+            "size_bytes": len(data),
+            "source_mtime_ns": source_mtime_ns,
+        }
+    except Exception as e:
+        logging.error(f"Image fingerprint failed for {file_path}: {e}")
+        return None
+
+def fingerprint_files(paths_and_keys, max_workers=None):
+    """Fingerprint banyak gambar paralel di process pool (decode JPEG terikat CPU)"""
+    if not paths_and_keys:
+        return []
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers == 1 or len(paths_and_keys) < 32:
+        return [r for r in map(fingerprint_file, paths_and_keys) if r is not None]
+    chunksize = max(1, len(paths_and_keys) // (max_workers * 4))
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return [r for r in pool.map(fingerprint_file, paths_and_keys, chunksize=chunksize) if r is not None]
+
+def hamming_distances(hashes, target):
+    """Jarak Hamming antara satu dHash dan array dHash (vektor)"""
+    xor = np.bitwise_xor(hashes.astype(np.int64), np.int64(target))
+    return _POPCOUNT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+def _closest_duplicate(hashes, vectors, record, max_distance, min_cosine):
+    """Posisi kandidat duplikat terbaik (dHash lalu cosine), atau None"""
+    candidates = np.flatnonzero(hamming_distances(hashes, record["dhash"]) <= max_distance)
+    if len(candidates) == 0:
+        return None
+    scores = vectors[candidates] @ np.asarray(record["feature_vector"], dtype=np.float32)
+    best = int(np.argmax(scores))
+    return int(candidates[best]) if scores[best] >= min_cosine else None
+
+class ImageIndex:
+    """Index in-memory: dHash (deteksi duplikat) + vektor fitur (nearest neighbour cosine)"""
+
+    def __init__(self):
+        self.keys = []
+        self.positions = {}
+        self.categories = []
+        self.duplicate_of = []
+        self.source_mtime_ns = []
+        self.md5 = {}
+        self.hashes = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, VECTOR_DIM), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, image_key):
+        return image_key in self.positions
+
+    def is_current(self, image_key, source_mtime_ns):
+        """True jika gambar sudah terindeks dari versi file yang sama (mtime)"""
+        position = self.positions.get(image_key)
+        return position is not None and self.source_mtime_ns[position] == source_mtime_ns
+
+    def add(self, records):
+        records = [r for r in records if r["image_key"] not in self.positions]
+        if not records:
+            return
+        for r in records:
+            self.positions[r["image_key"]] = len(self.keys)
+            self.keys.append(r["image_key"])
+            self.md5.setdefault(r["md5"], r["image_key"])
+        self.categories.extend(r.get("category") for r in records)
+        self.duplicate_of.extend(r.get("duplicate_of") for r in records)
+        self.source_mtime_ns.extend(r.get("source_mtime_ns") for r in records)
+        self.hashes = np.concatenate([self.hashes, np.array([r["dhash"] for r in records], dtype=np.int64)])
+        self.vectors = np.vstack([self.vectors, np.stack([np.asarray(r["feature_vector"], dtype=np.float32) for r in records])])
+
+    def discard(self, image_keys):
+        """Buang gambar dari index (mis. file berubah dan akan di-fingerprint ulang)"""
+        drop = {self.positions[k] for k in image_keys if k in self.positions}
+        if not drop:
+            return
+        keep = np.array([i not in drop for i in range(len(self.keys))], dtype=bool)
+        self.keys = [k for k, kept in zip(self.keys, keep) if kept]
+        self.categories = [c for c, kept in zip(self.categories, keep) if kept]
+        self.duplicate_of = [d for d, kept in zip(self.duplicate_of, keep) if kept]
+        self.source_mtime_ns = [m for m, kept in zip(self.source_mtime_ns, keep) if kept]
+        self.positions = {k: i for i, k in enumerate(self.keys)}
+        self.md5 = {m: k for m, k in self.md5.items() if k in self.positions}
+        self.hashes = self.hashes[keep]
+        self.vectors = self.vectors[keep]
+
+    def nearest(self, image_key, k=5):
+        """Top-k gambar paling mirip (cosine, vektor sudah dinormalisasi L2), tanpa gambar itu sendiri & duplikatnya"""
+        position = self.positions.get(image_key)
+        if position is None:
+            return []
+        scores = self.vectors @ self.vectors[position]
+        results = []
+        for i in np.argsort(-scores):
+            candidate = self.keys[i]
+            if candidate == image_key or self.duplicate_of[i] == image_key or self.duplicate_of[position] == candidate:
+                continue
+            results.append((candidate, float(scores[i])))
+            if len(results) == k:
+                break
+        return results
+
+    @classmethod
+    def from_table(cls, table):
+        index = cls()
+        if table.num_rows == 0:
+            return index
+        vectors = table.column("feature_vector").combine_chunks().flatten().to_numpy().reshape(-1, VECTOR_DIM)
+        columns = {name: table.column(name).to_pylist()
+                   for name in ("image_key", "category", "md5", "dhash", "duplicate_of", "source_mtime_ns")}
+        index.add([
+            {name: values[i] for name, values in columns.items()} | {"feature_vector": vectors[i]}
+            for i in range(table.num_rows)
+        ])
+        return index
+
+INDEX_SCHEMA = pa.schema([
+    ("image_key", pa.string()),
+    ("category", pa.string()),
+    ("md5", pa.string()),
+    ("dhash", pa.int64()),
+    ("feature_vector", pa.list_(pa.float32(), VECTOR_DIM)),
+    ("width", pa.int32()),
+    ("height", pa.int32()),
+    ("size_bytes", pa.int64()),
+    ("source_mtime_ns", pa.int64()),
+    ("duplicate_of", pa.string()),
+    ("processed_at", pa.timestamp("us", tz="UTC")),
+])
+
+def records_to_table(records):
+    processed_at = datetime.now(timezone.utc)
+    columns = {
+        name: [r.get(name) for r in records]
+        for name in INDEX_SCHEMA.names if name not in ("feature_vector", "processed_at")
+    }
+    columns["feature_vector"] = [np.asarray(r["feature_vector"], dtype=np.float32) for r in records]
+    columns["processed_at"] = [processed_at] * len(records)
+    return pa.table({name: pa.array(columns[name], INDEX_SCHEMA.field(name).type) for name in INDEX_SCHEMA.names})
+
+def _conform(table):
+    """Samakan part lama (kolom kurang, mis. source_mtime_ns) dengan INDEX_SCHEMA"""
+    return pa.table({
+        field.name: table.column(field.name).cast(field.type) if field.name in table.column_names
+        else pa.nulls(table.num_rows, field.type)
+        for field in INDEX_SCHEMA
+    })
+
+def _write_table(s3_client, bucket, prefix, table):
+    sink = pa.BufferOutputStream()
+    pq.write_table(table, sink, compression="zstd")
+    key = f"{prefix}part-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')}.parquet"
+    s3_client.put_object(Bucket=bucket, Key=key, Body=sink.getvalue().to_pybytes())
+    return key
+
+def write_index_part(s3_client, bucket, prefix, records):
+    """Tulis batch fingerprint baru sebagai satu file parquet (append-only) di lake"""
+    if not records:
+        return None
+    return _write_table(s3_client, bucket, prefix, records_to_table(records))
+
+def list_index_parts(s3_client, bucket, prefix):
+    paginator = s3_client.get_paginator('list_objects_v2')
+    return sorted(
+        obj['Key']
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+        for obj in page.get('Contents', [])
+        if obj['Key'].endswith('.parquet')
+    )
+
+def read_index_table(s3_client, bucket, prefix, part_keys=None):
+    """Gabungkan part parquet (default semua); satu baris per image_key (fingerprint terbaru menang)"""
+    if part_keys is None:
+        part_keys = list_index_parts(s3_client, bucket, prefix)
+    tables = [
+        _conform(pq.read_table(io.BytesIO(s3_client.get_object(Bucket=bucket, Key=key)['Body'].read())))
+        for key in part_keys
+    ]
+    if not tables:
+        return INDEX_SCHEMA.empty_table(), part_keys
+    table = pa.concat_tables(tables)
+    table = table.take(pc.sort_indices(table, [("processed_at", "ascending")]))
+    latest = {key: i for i, key in enumerate(table.column("image_key").to_pylist())}
+    return table.take(pa.array(sorted(latest.values()), pa.int64())), part_keys
+
+def compact_index(s3_client, bucket, prefix, table, part_keys):
+    """Tulis index sebagai satu part, lalu hapus part lama (pembaca tetap konsisten: dedupe per key)"""
+    if len(part_keys) <= 1:
+        return None
+    new_key = _write_table(s3_client, bucket, prefix, table)
+    stale = [key for key in part_keys if key != new_key]
+    for i in range(0, len(stale), 1000):
+        s3_client.delete_objects(Bucket=bucket, Delete={
+            "Objects": [{"Key": key} for key in stale[i:i + 1000]], "Quiet": True
+        })
+    return new_key
+
+def load_index(s3_client, bucket, prefix):
+    """Bangun ImageIndex dari semua part parquet yang sudah ada di lake"""
+    table, _ = read_index_table(s3_client, bucket, prefix)
+    return ImageIndex.from_table(table)
+
+def dedupe_and_add(index, records, max_distance=DUPLICATE_MAX_HAMMING, min_cosine=DUPLICATE_MIN_COSINE):
+    """Tandai duplikat terhadap index (termasuk antar record baru) lalu tambahkan ke index sekaligus"""
+    records = [r for r in records if not index.is_current(r["image_key"], r.get("source_mtime_ns"))]
+    if not records:
+        return records
+    # File yang berubah: buang fingerprint lama dulu agar tidak terdeteksi sebagai duplikat dirinya sendiri
+    index.discard([r["image_key"] for r in records])
+    keys = index.keys + [r["image_key"] for r in records]
+    hashes = np.concatenate([index.hashes, np.array([r["dhash"] for r in records], dtype=np.int64)])
+    vectors = np.vstack([index.vectors, np.stack([np.asarray(r["feature_vector"], dtype=np.float32) for r in records])])
+    md5_seen = dict(index.md5)
+    n_existing = len(index)
+    for i, record in enumerate(records):
+        duplicate_of = md5_seen.get(record["md5"])
+        if duplicate_of is None and n_existing + i > 0:
+            # Hanya bandingkan dengan gambar yang sudah ada sebelum record ini
+            best = _closest_duplicate(hashes[:n_existing + i], vectors[:n_existing + i], record, max_distance, min_cosine)
+            if best is not None:
+                duplicate_of = keys[best]
+        md5_seen.setdefault(record["md5"], record["image_key"])
+        record["duplicate_of"] = duplicate_of
+        if duplicate_of:
+            logging.debug(f"Duplicate image detected: {record['image_key']} ~ {duplicate_of}")
+    index.add(records)
+    return records
+
+def list_local_images(base_path):
+    """(path lokal, key S3, mtime ns) untuk semua gambar di bawah base_path"""
+    found = []
+    for root, _, files in os.walk(base_path):
+        for filename in files:
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                file_path = os.path.join(root, filename)
+                found.append((file_path, os.path.relpath(file_path, base_path).replace("\\", "/"),
+                              os.stat(file_path).st_mtime_ns))
+    return sorted(found, key=lambda item: item[1])
@@ -0,0 +1,435 @@
+"""Format tabel ringan berbasis manifest untuk layer silver/gold di MinIO.
+
+Layout satu tabel (prefix di dalam bucket):
+
+    <table>/data/<commit-id>/part-*.parquet   file data, tidak pernah ditimpa
+    <table>/_manifests/v00000003.json         manifest versi 3 (immutable)
+    <table>/_manifests/_latest.json           salinan manifest terbaru = titik commit
+
+Commit: file data ditulis ke direktori baru, lalu manifest versi baru, lalu _latest.json
+(satu PUT, atomic di S3/MinIO). Reader hanya melihat file yang tercantum di manifest, jadi
+tidak pernah membaca tabel yang setengah tertulis. Snapshot terbaru di-resolve dengan satu
+GET; versi lama tetap bisa dibaca (pinned) selama belum di-expire. Manifest menyimpan jumlah
+baris dan min/max/null per kolom per file (dari footer parquet) untuk melewati file
+berdasarkan predikat.
+
+Diasumsikan satu writer per tabel (job ETL); reader bisa berjalan kapan saja.
+"""
+import io
+import os
+import re
+import json
+import math
+import time
+import uuid
+import decimal
+import logging
+from urllib.parse import unquote
+from datetime import date, datetime, timezone
+import pandas as pd
+import pyarrow.parquet as pq
+from botocore.exceptions import ClientError
+
+FORMAT_VERSION = 1
+DATA_DIR = "data"
+MANIFEST_DIR = "_manifests"
+LATEST_MANIFEST = "_latest.json"
+# Jumlah versi yang dipertahankan (bisa dibaca pinned); data versi lebih lama dihapus saat commit
+RETAIN_VERSIONS = int(os.getenv("LAKE_TABLE_RETAIN_VERSIONS", "10"))
+# File data yang tidak tercantum di manifest mana pun (commit gagal/konflik) dihapus saat expire
+# setelah berumur lebih dari ini, agar commit yang sedang menulis tidak ikut terhapus
+ORPHAN_GRACE_SECONDS = int(os.getenv("LAKE_TABLE_ORPHAN_GRACE_SECONDS", "3600"))
+
+PRUNABLE_OPS = ("=", "==", "!=", "<", "<=", ">", ">=", "in")
+
+# Tipe Arrow (string di manifest) -> tipe Spark SQL, untuk DataFrame kosong dengan skema tabel
+_SPARK_TYPES = {
+    "bool": "BOOLEAN", "int8": "TINYINT", "int16": "SMALLINT", "int32": "INT", "int64": "BIGINT",
+    "float": "FLOAT", "double": "DOUBLE", "string": "STRING", "large_string": "STRING",
+    "binary": "BINARY", "date32[day]": "DATE",
+}
+
+logger = logging.getLogger(__name__)
+
+class SnapshotNotFoundError(FileNotFoundError):
+    pass
+
+class CommitConflictError(RuntimeError):
+    pass
+
+def _table_prefix(table):
+    return table.strip("/") + "/"
+
+def _data_root(table):
+    return f"{_table_prefix(table)}{DATA_DIR}/"
+
+def _commit_dir(table, key):
+    """Direktori commit (<table>/data/<commit-id>/) tempat sebuah file data ditulis"""
+    return _data_root(table) + key[len(_data_root(table)):].split("/", 1)[0] + "/"
+
+def _spark_type(arrow_type):
+    if arrow_type.startswith("timestamp"):
+        return "TIMESTAMP"
+    decimal_type = re.match(r"decimal\d*\((\d+), (\d+)\)", arrow_type)
+    if decimal_type:
+        return f"DECIMAL({decimal_type.group(1)}, {decimal_type.group(2)})"
+    return _SPARK_TYPES.get(arrow_type, "STRING")
+
+def _manifest_key(table, version):
+    return f"{_table_prefix(table)}{MANIFEST_DIR}/v{version:08d}.json"
+
+def _latest_key(table):
+    return f"{_table_prefix(table)}{MANIFEST_DIR}/{LATEST_MANIFEST}"
+
+def _json_value(value):
+    """Nilai statistik/predikat dalam bentuk yang bisa disimpan di JSON dan dibandingkan"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, bytes):
+        try:
+            return value.decode("utf-8")
+        except UnicodeDecodeError:
+            return None
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+def _list_keys(s3_client, bucket, prefix):
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            yield obj
+
+def _get_json(s3_client, bucket, key):
+    try:
+        return json.loads(s3_client.get_object(Bucket=bucket, Key=key)["Body"].read())
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404", "NotFound"):
+            return None
+        raise
+
+def _put_json(s3_client, bucket, key, payload):
+    s3_client.put_object(Bucket=bucket, Key=key, Body=json.dumps(payload, indent=1).encode("utf-8"),
+                         ContentType="application/json")
+
+class _S3RangeFile(io.RawIOBase):
+    """File read-only di S3 yang hanya mengambil byte range yang dibaca (cukup footer parquet)"""
+
+    def __init__(self, s3_client, bucket, key, size):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.size}[whence]
+        self.position = base + offset
+        return self.position
+
+    def readinto(self, buffer):
+        end = min(self.position + len(buffer), self.size)
+        if end <= self.position:
+            return 0
+        body = self.s3_client.get_object(
+            Bucket=self.bucket, Key=self.key, Range=f"bytes={self.position}-{end - 1}"
+        )["Body"].read()
+        buffer[:len(body)] = body
+        self.position += len(body)
+        return len(body)
+
+def file_stats(s3_client, bucket, key, size):
+    """Jumlah baris, skema, dan min/max/null per kolom dari footer parquet (tanpa membaca data)"""
+    metadata = pq.read_metadata(_S3RangeFile(s3_client, bucket, key, size))
+    columns = {}
+    for i in range(metadata.num_columns):
+        name = metadata.schema.column(i).path
+        if "." in name:
+            continue  # hanya kolom top-level
+        mins, maxs, null_count, complete = [], [], 0, True
+        for rg in range(metadata.num_row_groups):
+            stats = metadata.row_group(rg).column(i).statistics
+            if stats is None or not stats.has_min_max:
+                complete = False
+                break
+            mins.append(_json_value(stats.min))
+            maxs.append(_json_value(stats.max))
+            null_count += stats.null_count
+        if complete and mins and None not in mins and None not in maxs:
+            columns[name] = {"min": min(mins), "max": max(maxs), "null_count": null_count}
+    schema = [{"name": field.name, "type": str(field.type)} for field in metadata.schema.to_arrow_schema()]
+    return {"row_count": metadata.num_rows, "columns": columns}, schema
+
+def _partition_values(relative_key, partition_columns):
+    """Nilai partisi dari path gaya Hive (kolom=nilai/...)"""
+    values = {}
+    for part in relative_key.split("/")[:-1]:
+        name, sep, value = part.partition("=")
+        if sep and name in partition_columns:
+            values[name] = None if value == "__HIVE_DEFAULT_PARTITION__" else unquote(value)
+    return values
+
+def _may_match(file_entry, filters):
+    """False jika statistik file membuktikan tidak ada baris yang memenuhi semua filter"""
+    for column, op, value in filters:
+        if column in file_entry.get("partition", {}):
+            low = high = file_entry["partition"][column]
+            value = [str(_json_value(v)) for v in value] if op == "in" else str(_json_value(value))
+        elif column in file_entry.get("columns", {}):
+            low, high = file_entry["columns"][column]["min"], file_entry["columns"][column]["max"]
+            value = [_json_value(v) for v in value] if op == "in" else _json_value(value)
+        else:
+            continue
+        if low is None or op not in PRUNABLE_OPS:
+            continue
+        try:
+            if op in ("=", "==") and (value < low or value > high):
+                return False
+            if op == "!=" and low == high == value:
+                return False
+            if op == "<" and low >= value:
+                return False
+            if op == "<=" and low > value:
+                return False
+            if op == ">" and high <= value:
+                return False
+            if op == ">=" and high < value:
+                return False
+            if op == "in" and all(v is None or v < low or v > high for v in value):
+                return False
+        except TypeError:
+            continue  # tipe predikat tidak sebanding dengan statistik: jangan lewati file
+    return True
+
+class Snapshot:
+    """Satu versi tabel yang sudah di-commit (isi manifest)"""
+
+    def __init__(self, bucket, manifest):
+        self.bucket = bucket
+        self.manifest = manifest
+
+    @property
+    def table(self):
+        return self.manifest["table"]
+
+    @property
+    def version(self):
+        return self.manifest["version"]
+
+    @property
+    def files(self):
+        return self.manifest["files"]
+
+    @property
+    def row_count(self):
+        return self.manifest["row_count"]
+
+    @property
+    def partition_columns(self):
+        return self.manifest.get("partition_columns", [])
+
+    def prune(self, filters=None):
+        """File yang mungkin berisi baris yang cocok dengan filter [(kolom, op, nilai), ...] (AND)"""
+        if not filters:
+            return list(self.files)
+        return [f for f in self.files if _may_match(f, filters)]
+
+    def keys(self, filters=None):
+        return [f["key"] for f in self.prune(filters)]
+
+    def uris(self, filters=None, scheme="s3a"):
+        """URI file data (tanpa kolom partisi di path); untuk Spark pakai read_spark()"""
+        return [f"{scheme}://{self.bucket}/{key}" for key in self.keys(filters)]
+
+    def read_spark(self, spark, filters=None):
+        """Baca snapshot sebagai DataFrame Spark, termasuk kolom partisi; filter hanya untuk melewati file.
+
+        File bisa berasal dari beberapa direktori commit (append/replace_partitions), jadi setiap
+        direktori dibaca dengan basePath-nya sendiri agar kolom partisi (kolom=nilai/) tetap ada.
+        """
+        groups = {}
+        for key in self.keys(filters):
+            groups.setdefault(_commit_dir(self.table, key), []).append(f"s3a://{self.bucket}/{key}")
+        if not groups:
+            return self._empty_spark_frame(spark)
+        frames = [
+            spark.read.option("basePath", f"s3a://{self.bucket}/{base}").parquet(*uris)
+            for base, uris in groups.items()
+        ]
+        df = frames[0]
+        for frame in frames[1:]:
+            df = df.unionByName(frame, allowMissingColumns=True)
+        return df
+
+    def _empty_spark_frame(self, spark):
+        """spark.read.parquet() tanpa path gagal; snapshot kosong -> DataFrame kosong berskema tabel"""
+        fields = [(field["name"], _spark_type(field["type"])) for field in self.manifest["schema"]]
+        fields += [(name, "STRING") for name in self.partition_columns if name not in dict(fields)]
+        if not fields:
+            return spark.range(0).drop("id")
+        return spark.createDataFrame([], ", ".join(f"`{name}` {spark_type}" for name, spark_type in fields))
+
+    def to_pandas(self, s3_client, filters=None, columns=None):
+        """Baca snapshot ke DataFrame; file dilewati via statistik, baris difilter pyarrow"""
+        files = self.prune(filters)
+        row_filters = [f for f in (filters or []) if f[0] not in self.partition_columns] or None
+        frames = []
+        for entry in files:
+            body = s3_client.get_object(Bucket=self.bucket, Key=entry["key"])["Body"].read()
+            file_columns = [c for c in columns if c not in self.partition_columns] if columns else None
+            df = pq.read_table(io.BytesIO(body), columns=file_columns, filters=row_filters).to_pandas()
+            for name, value in entry.get("partition", {}).items():
+                if columns is None or name in columns:
+                    df[name] = value
+            frames.append(df)
+        logger.info(f"{self.bucket}/{self.table} v{self.version}: read {len(files)} of {len(self.files)} files")
+        if not frames:
+            return pd.DataFrame(columns=columns or [field["name"] for field in self.manifest["schema"]])
+        return pd.concat(frames, ignore_index=True)
+
+def load_snapshot(s3_client, bucket, table, version=None):
+    """Snapshot terbaru (satu GET ke _latest.json) atau versi tertentu (pinned)"""
+    key = _latest_key(table) if version is None else _manifest_key(table, int(version))
+    manifest = _get_json(s3_client, bucket, key)
+    if manifest is None:
+        which = "no committed snapshot" if version is None else f"snapshot version {version} not found (expired?)"
+        raise SnapshotNotFoundError(f"Table '{bucket}/{table}': {which}")
+    return Snapshot(bucket, manifest)
+
+def list_versions(s3_client, bucket, table):
+    prefix = f"{_table_prefix(table)}{MANIFEST_DIR}/v"
+    return sorted(int(obj["Key"][len(prefix):-len(".json")]) for obj in _list_keys(s3_client, bucket, prefix)
+                  if obj["Key"].endswith(".json"))
+
+def new_data_prefix(table):
+    """Direktori data baru yang unik untuk satu commit"""
+    commit_id = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    return f"{_table_prefix(table)}{DATA_DIR}/{commit_id}/"
+
+def commit(s3_client, bucket, table, data_prefix, mode="overwrite", partition_columns=None, retain=RETAIN_VERSIONS):
+    """Daftarkan file parquet di data_prefix sebagai versi baru tabel.
+
+    mode: 'overwrite' (ganti semua file), 'append' (tambah ke versi sebelumnya), atau
+    'replace_partitions' (ganti hanya partisi yang ditulis ulang, sisanya dipertahankan).
+    """
+    if mode not in ("overwrite", "append", "replace_partitions"):
+        raise ValueError(f"Unknown commit mode: {mode}")
+    partition_columns = list(partition_columns or [])
+
+    new_files, schema = [], None
+    for obj in _list_keys(s3_client, bucket, data_prefix):
+        if not obj["Key"].endswith(".parquet"):
+            continue  # _SUCCESS, .crc, dll.
+        stats, file_schema = file_stats(s3_client, bucket, obj["Key"], obj["Size"])
+        schema = schema or file_schema
+        new_files.append({
+            "key": obj["Key"],
+            "size_bytes": obj["Size"],
+            "partition": _partition_values(obj["Key"][len(data_prefix):], partition_columns),
+            **stats,
+        })
+
+    parent = _get_json(s3_client, bucket, _latest_key(table))
+    files = list(new_files)
+    if parent is not None and mode == "append":
+        files = parent["files"] + files
+    elif parent is not None and mode == "replace_partitions":
+        rewritten = {tuple(sorted(f["partition"].items())) for f in new_files}
+        files = [f for f in parent["files"] if tuple(sorted(f.get("partition", {}).items())) not in rewritten] + files
+    if schema is None and parent is not None:
+        schema = parent["schema"]
+
+    version = parent["version"] + 1 if parent is not None else 1
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "table": table.strip("/"),
+        "version": version,
+        "parent_version": parent["version"] if parent is not None else None,
+        "operation": mode,
+        "committed_at": datetime.now(timezone.utc).isoformat(),
+        "data_prefix": data_prefix,
+        "partition_columns": partition_columns,
+        "schema": schema or [],
+        "row_count": sum(f["row_count"] for f in files),
+        "size_bytes": sum(f["size_bytes"] for f in files),
+        "files": files,
+    }
+
+    _put_json(s3_client, bucket, _manifest_key(table, version), manifest)
+    # Cek writer lain tidak commit sejak parent dibaca, lalu publish (titik commit)
+    current = _get_json(s3_client, bucket, _latest_key(table))
+    if (current or {}).get("version") != (parent or {}).get("version"):
+        raise CommitConflictError(
+            f"Table '{bucket}/{table}' was committed concurrently (expected parent v{manifest['parent_version']}, "
+            f"found v{(current or {}).get('version')}); data in {data_prefix} left uncommitted"
+        )
+    _put_json(s3_client, bucket, _latest_key(table), manifest)
+
+    if retain:
+        expire_versions(s3_client, bucket, table, retain)
+    return Snapshot(bucket, manifest)
+
+def expire_versions(s3_client, bucket, table, retain=RETAIN_VERSIONS, orphan_grace_seconds=ORPHAN_GRACE_SECONDS):
+    """Hapus manifest dan file data yang hanya dipakai oleh versi di luar `retain` versi terakhir,
+    serta file data yatim (commit gagal/konflik) yang tidak tercantum di manifest mana pun"""
+    versions = list_versions(s3_client, bucket, table)
+    expired, retained = versions[:-retain], versions[-retain:]
+    referenced, retained_dirs = set(), set()
+    for version in retained:
+        manifest = _get_json(s3_client, bucket, _manifest_key(table, version)) or {"files": []}
+        referenced.update(f["key"] for f in manifest["files"])
+        if manifest.get("data_prefix"):
+            retained_dirs.add(manifest["data_prefix"])
+
+    to_delete, expired_files = set(), set()
+    for version in expired:
+        manifest = _get_json(s3_client, bucket, _manifest_key(table, version))
+        if manifest is not None:
+            expired_files.update(f["key"] for f in manifest["files"])
+        to_delete.add(_manifest_key(table, version))
+
+    # Semua objek data yang tidak dipakai versi yang dipertahankan: file versi expired langsung
+    # dihapus; objek lain (commit gagal/konflik, _SUCCESS) hanya jika sudah melewati masa tenggang
+    orphan_cutoff = time.time() - orphan_grace_seconds
+    orphans = 0
+    for obj in _list_keys(s3_client, bucket, _data_root(table)):
+        key = obj["Key"]
+        if key in referenced or _commit_dir(table, key) in retained_dirs:
+            continue
+        if key in expired_files:
+            to_delete.add(key)
+        elif obj["LastModified"].timestamp() < orphan_cutoff:
+            to_delete.add(key)
+            orphans += 1
+    to_delete = sorted(to_delete)
+
+    for start in range(0, len(to_delete), 1000):
+        s3_client.delete_objects(Bucket=bucket, Delete={
+            "Objects": [{"Key": key} for key in to_delete[start:start + 1000]], "Quiet": True
+        })
+    if orphans:
+        logger.info(f"Expired {bucket}/{table.strip('/')}: removed {orphans} orphaned data objects")
+    return len(expired)
+
+def write_spark_table(df, s3_client, bucket, table, mode="overwrite", partition_by=None):
+    """Tulis DataFrame Spark ke direktori data baru lalu commit manifest-nya"""
+    data_prefix = new_data_prefix(table)
+    writer = df.write.mode("errorifexists")
+    if partition_by:
+        writer = writer.partitionBy(*partition_by)
+    writer.parquet(f"s3a://{bucket}/{data_prefix}")
+    snapshot = commit(s3_client, bucket, table, data_prefix, mode=mode, partition_columns=partition_by)
+    logger.info(f"Committed {bucket}/{snapshot.table} v{snapshot.version}: "
+                f"{len(snapshot.files)} files, {snapshot.row_count} rows")
+    return snapshot
@@ -0,0 +1,60 @@
+"""Benchmark overhead prediction interval (p10/p50/p90 antar pohon) dibanding prediksi titik.
+
+Contoh: docker-compose exec fastapi python benchmark_intervals.py --run-id <RUN_ID>
+"""
+import argparse
+import time
+import warnings
+import numpy as np
+import pandas as pd
+import mlflow.pyfunc
+import mlflow.sklearn
+from forest_intervals import CompiledForest
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--run-id", required=True)
+parser.add_argument("--tracking-uri", default="file:///app/mlruns")
+parser.add_argument("--batch-sizes", default="1,100,10000")
+parser.add_argument("--repeats", type=int, default=20)
+args = parser.parse_args()
+
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+def timed(fn, repeats):
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1000
+
+def synthetic_input(features, n, rng):
+    columns = {
+        'cost_price': rng.uniform(5, 300, n).astype('float32'),
+        'freight_value': rng.uniform(0, 60, n),
+        'delivery_days': rng.integers(1, 40, n).astype('float64'),
+        'review_score': rng.integers(1, 6, n).astype(str),
+        'distance_km': rng.uniform(0, 3000, n),
+    }
+    return pd.DataFrame({name: columns[name] for name in features})
+
+if __name__ == "__main__":
+    mlflow.set_tracking_uri(args.tracking_uri)
+    model_uri = f"runs:/{args.run_id}/model"
+    pyfunc_model = mlflow.pyfunc.load_model(model_uri)
+    forest = mlflow.sklearn.load_model(model_uri)
+    compiled = CompiledForest(forest)
+    features = pyfunc_model.metadata.get_input_schema().input_names()
+    rng = np.random.default_rng(42)
+
+    print(f"Model {args.run_id}: {compiled.n_trees} trees, max depth {compiled.max_depth}, features {features}")
+    print(f"{'batch':>7} | {'pyfunc point':>12} | {'sklearn point':>13} | {'per-tree loop':>13} | {'vectorized p10/50/90':>20} | overhead vs pyfunc")
+    for n in [int(b) for b in args.batch_sizes.split(",")]:
+        input_df = synthetic_input(features, n, rng)
+        X = input_df.astype('float32').to_numpy()
+        repeats = max(1, args.repeats if n <= 1000 else args.repeats // 10)
+
+        t_pyfunc = timed(lambda: pyfunc_model.predict(input_df), repeats)
+        t_sklearn = timed(lambda: forest.predict(input_df), repeats)
+        t_loop = timed(lambda: np.percentile(np.stack([t.predict(X) for t in forest.estimators_]), [10, 50, 90], axis=0), repeats)
+        t_vector = timed(lambda: compiled.predict_with_quantiles(X), repeats)
+        print(f"{n:>7} | {t_pyfunc:>9.2f} ms | {t_sklearn:>10.2f} ms | {t_loop:>10.2f} ms | {t_vector:>17.2f} ms | {t_vector / t_pyfunc:.2f}x")
@@ -0,0 +1,235 @@
+import bisect
+import math
+import threading
+import time
+import numpy as np
+from datetime import datetime, timezone
+
+# Ambang PSI (Population Stability Index) yang umum dipakai
+PSI_WARN = 0.1
+PSI_DRIFT = 0.25
+REPORTED_QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+class QuantileSketch:
+    """Sketch kuantil log-bucket (gaya DDSketch): memori tetap, update O(1), bisa di-merge.
+
+    Nilai dengan |x| di luar [min_value, max_value] di-clip ke bucket terluar.
+    """
+
+    def __init__(self, relative_accuracy=0.01, min_value=1e-3, max_value=1e7):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.offset = math.ceil(math.log(min_value) / self.log_gamma)
+        n_buckets = math.ceil(math.log(max_value) / self.log_gamma) - self.offset + 1
+        self.positive = np.zeros(n_buckets, dtype=np.int64)
+        self.negative = np.zeros(n_buckets, dtype=np.int64)
+        self.zero = 0
+        self.count = 0
+
+    def _key(self, magnitude):
+        k = math.ceil(math.log(magnitude) / self.log_gamma) - self.offset
+        return min(max(k, 0), len(self.positive) - 1)
+
+    def add(self, x):
+        if x != x:  # NaN
+            return
+        if x > self.min_value:
+            self.positive[self._key(x)] += 1
+        elif x < -self.min_value:
+            self.negative[self._key(-x)] += 1
+        else:
+            self.zero += 1
+        self.count += 1
+
+    def add_many(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        for store, mask, magnitude in (
+            (self.positive, values > self.min_value, values),
+            (self.negative, values < -self.min_value, -values),
+        ):
+            if mask.any():
+                keys = np.ceil(np.log(magnitude[mask]) / self.log_gamma).astype(np.int64) - self.offset
+                np.add.at(store, np.clip(keys, 0, len(store) - 1), 1)
+        self.zero += int(np.count_nonzero(np.abs(values) <= self.min_value))
+        self.count += len(values)
+
+    def merge(self, other):
+        self.positive += other.positive
+        self.negative += other.negative
+        self.zero += other.zero
+        self.count += other.count
+
+    def _value(self, key):
+        return 2 * self.gamma ** (key + self.offset) / (self.gamma + 1)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        # Urutan naik: negatif (magnitudo terbesar dulu), nol, lalu positif
+        seen = 0
+        for key in range(len(self.negative) - 1, -1, -1):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        cumulative = seen + np.cumsum(self.positive)
+        key = int(np.searchsorted(cumulative, rank, side='right'))
+        return self._value(min(key, len(self.positive) - 1))
+
+class FixedHistogram:
+    """Histogram dengan batas bin tetap (dari profil referensi), memori tetap, bisa di-merge"""
+
+    def __init__(self, inner_edges):
+        self.inner_edges = np.asarray(inner_edges, dtype=np.float64)
+        self._edges_list = self.inner_edges.tolist()  # bisect pada list lebih cepat untuk skalar
+        self.counts = np.zeros(len(self.inner_edges) + 1, dtype=np.int64)
+
+    def add(self, x):
+        if x == x:
+            self.counts[bisect.bisect_right(self._edges_list, x)] += 1
+
+    def add_many(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.counts += np.bincount(
+            np.searchsorted(self.inner_edges, values, side='right'), minlength=len(self.counts)
+        )
+
+    def merge(self, other):
+        self.counts += other.counts
+
+def population_stability_index(expected_fractions, actual_counts, eps=1e-4):
+    expected = np.clip(np.asarray(expected_fractions, dtype=np.float64), eps, None)
+    actual = np.clip(actual_counts / max(actual_counts.sum(), 1), eps, None)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+class _Window:
+    """Satu jendela waktu: sketch + histogram + hitungan out-of-range per seri"""
+
+    def __init__(self, reference):
+        self.started_at = time.time()
+        self.sketches = {}
+        self.histograms = {}
+        self.out_of_range = {}
+        for name, profile in reference.items():
+            self.sketches[name] = QuantileSketch()
+            self.histograms[name] = FixedHistogram(profile.get('bin_edges', []))
+            self.out_of_range[name] = 0
+
+    def merged_with(self, other):
+        merged = _Window({})
+        for name in self.sketches:
+            merged.sketches[name] = QuantileSketch()
+            merged.sketches[name].merge(self.sketches[name])
+            merged.sketches[name].merge(other.sketches[name])
+            merged.histograms[name] = FixedHistogram(self.histograms[name].inner_edges)
+            merged.histograms[name].merge(self.histograms[name])
+            merged.histograms[name].merge(other.histograms[name])
+            merged.out_of_range[name] = self.out_of_range[name] + other.out_of_range[name]
+        return merged
+
+class DriftMonitor:
+    """Monitor drift streaming untuk fitur yang dilayani dan prediksi.
+
+    Menyimpan dua jendela (sebelumnya & sekarang) yang dirotasi tiap window_seconds; drift
+    dihitung dari gabungan keduanya terhadap profil referensi dari run training, dan hasilnya
+    di-cache selama eval_interval_seconds.
+    """
+
+    def __init__(self, reference, run_id=None, window_seconds=3600, eval_interval_seconds=30, min_observations=50):
+        self.reference = reference or {}
+        self.run_id = run_id
+        self.window_seconds = window_seconds
+        self.eval_interval_seconds = eval_interval_seconds
+        self.min_observations = min_observations
+        self._lock = threading.Lock()
+        self._previous = _Window(self.reference)
+        self._current = _Window(self.reference)
+        self._last_report = None
+        self._last_report_at = 0.0
+
+    @property
+    def series(self):
+        return list(self.reference)
+
+    def _rotate_if_needed(self):
+        elapsed = time.time() - self._current.started_at
+        if elapsed >= 2 * self.window_seconds:
+            # Tidak ada traffic selama >= 1 window penuh: window sekarang juga sudah basi
+            self._previous = _Window(self.reference)
+            self._current = _Window(self.reference)
+        elif elapsed >= self.window_seconds:
+            self._previous = self._current
+            self._current = _Window(self.reference)
+
+    def observe(self, values):
+        """Catat satu request: dict nama seri -> skalar atau array nilai"""
+        with self._lock:
+            self._rotate_if_needed()
+            window = self._current
+            for name, value in values.items():
+                if name not in window.sketches:
+                    continue
+                profile = self.reference[name]
+                if np.ndim(value) == 0:
+                    value = float(value)
+                    window.sketches[name].add(value)
+                    window.histograms[name].add(value)
+                    if value < profile['min'] or value > profile['max']:
+                        window.out_of_range[name] += 1
+                else:
+                    value = np.asarray(value, dtype=np.float64)
+                    window.sketches[name].add_many(value)
+                    window.histograms[name].add_many(value)
+                    window.out_of_range[name] += int(np.count_nonzero((value < profile['min']) | (value > profile['max'])))
+
+    def report(self, force=False):
+        """Skor drift per seri; dihitung ulang paling sering sekali per eval_interval_seconds"""
+        now = time.time()
+        if not force and self._last_report is not None and now - self._last_report_at < self.eval_interval_seconds:
+            return self._last_report
+
+        with self._lock:
+            self._rotate_if_needed()
+            window = self._current.merged_with(self._previous)
+
+        series = {}
+        for name, profile in self.reference.items():
+            sketch = window.sketches[name]
+            enough = sketch.count >= self.min_observations
+            psi = population_stability_index(profile['bin_fractions'], window.histograms[name].counts) if enough else None
+            if psi is None:
+                status = "insufficient_data"
+            elif psi >= PSI_DRIFT:
+                status = "drift"
+            elif psi >= PSI_WARN:
+                status = "warn"
+            else:
+                status = "ok"
+            series[name] = {
+                "observations": sketch.count,
+                "psi": round(psi, 4) if psi is not None else None,
+                "status": status,
+                "out_of_reference_range": round(window.out_of_range[name] / sketch.count, 4) if sketch.count else None,
+                "served_quantiles": {str(q): sketch.quantile(q) for q in REPORTED_QUANTILES},
+                "reference_quantiles": profile.get('quantiles', {}),
+            }
+
+        self._last_report = {
+            "run_id": self.run_id,
+            "reference_available": bool(self.reference),
+            "window_seconds": self.window_seconds,
+            "evaluated_at": datetime.now(timezone.utc).isoformat(),
+            "series": series,
+        }
+        self._last_report_at = now
+        return self._last_report
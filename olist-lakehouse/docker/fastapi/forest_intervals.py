@@ -0,0 +1,63 @@
+import numpy as np
+
+DEFAULT_QUANTILES = (10, 50, 90)
+# Batch besar diproses per blok baris agar matriks node (n_trees x blok) tetap muat di cache
+ROW_BLOCK_SIZE = 1024
+
+class CompiledForest:
+    """Semua pohon RandomForestRegressor digabung ke array node datar.
+
+    Prediksi per pohon untuk seluruh batch dihitung sekaligus: traversal berjalan per level
+    kedalaman untuk matriks node (n_trees, n_samples), tanpa loop Python per pohon.
+    """
+
+    def __init__(self, forest):
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        if any(tree.n_outputs != 1 for tree in trees):
+            raise ValueError("Only single-output forests are supported")
+
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+        self.roots = offsets[:-1].astype(np.int64)
+        self.feature = np.concatenate([tree.feature for tree in trees]).astype(np.int64)
+        self.threshold = np.concatenate([tree.threshold for tree in trees])
+        # Indeks anak digeser ke posisi global; daun (-1) diarahkan ke dirinya sendiri
+        left, right = [], []
+        for offset, tree in zip(offsets[:-1], trees):
+            own = np.arange(tree.node_count) + offset
+            left.append(np.where(tree.children_left >= 0, tree.children_left + offset, own))
+            right.append(np.where(tree.children_right >= 0, tree.children_right + offset, own))
+        self.children_left = np.concatenate(left).astype(np.int64)
+        self.children_right = np.concatenate(right).astype(np.int64)
+        self.value = np.concatenate([tree.value[:, 0, 0] for tree in trees])
+        self.max_depth = max(tree.max_depth for tree in trees)
+        # Daun (feature < 0) tetap di tempat karena anaknya menunjuk ke dirinya; fitur 0 hanya placeholder
+        self.split_feature = np.where(self.feature < 0, 0, self.feature)
+        self.n_trees = len(trees)
+        self.n_features = forest.n_features_in_
+
+    def predict_trees(self, X):
+        """Prediksi tiap pohon, shape (n_trees, n_samples)"""
+        # sklearn membandingkan fitur sebagai float32 terhadap threshold float64
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected input with {self.n_features} features, got shape {X.shape}")
+
+        if X.shape[0] > ROW_BLOCK_SIZE:
+            return np.concatenate([
+                self._traverse(X[start:start + ROW_BLOCK_SIZE]) for start in range(0, X.shape[0], ROW_BLOCK_SIZE)
+            ], axis=1)
+        return self._traverse(X)
+
+    def _traverse(self, X):
+        X_flat = np.ascontiguousarray(X).ravel()
+        row_offsets = (np.arange(X.shape[0]) * self.n_features)[None, :]
+        nodes = np.repeat(self.roots[:, None], X.shape[0], axis=1)
+        for _ in range(self.max_depth):
+            go_left = np.take(X_flat, row_offsets + np.take(self.split_feature, nodes)) <= np.take(self.threshold, nodes)
+            nodes = np.where(go_left, np.take(self.children_left, nodes), np.take(self.children_right, nodes))
+        return np.take(self.value, nodes)
+
+    def predict_with_quantiles(self, X, quantiles=DEFAULT_QUANTILES):
+        """Mean forest (= prediksi titik) dan persentil sebaran antar pohon per sampel"""
+        per_tree = self.predict_trees(X)
+        return per_tree.mean(axis=0), np.percentile(per_tree, quantiles, axis=0)
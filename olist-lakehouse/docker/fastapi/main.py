@@ -1,21 +1,66 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
+from typing import List, Optional
 import mlflow.pyfunc
+import mlflow.sklearn
+import mlflow.artifacts
+import json
+import logging
 import pandas as pd
 import numpy as np
+import boto3
 import os
+import lake_table
+from online_features import OnlineFeatureSnapshot, FEATURE_COLUMNS
+from drift_monitor import DriftMonitor
+from forest_intervals import CompiledForest, DEFAULT_QUANTILES
+
+# Log modul bersama (lake_table) ikut tampil di output container
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
 
 app = FastAPI(title="Olist Price Predictor API")
 
 # Use the actual run_id from training
 RUN_ID = "4477717b16df42a680f2765ce59f7f35"
 MODEL = None
+FOREST = None  # pohon-pohon model dalam bentuk array datar untuk prediction interval
+MODEL_FEATURES = ['cost_price', 'freight_value', 'delivery_days', 'review_score']
+
+# Lookup centroid zip prefix dari gold layer (hasil etl_pipeline.py)
+MINIO_ENDPOINT = os.getenv("MINIO_ENDPOINT", "http://minio:9000")
+MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
+MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY", "minioadmin")
+GOLD_BUCKET = os.getenv("MINIO_GOLD_BUCKET", "gold")
+GEO_CENTROIDS_PREFIX = "geo_zip_centroids/"
+ZIP_PREFIX_SPACE = 100000  # zip prefix Brasil = 5 digit
+EARTH_RADIUS_KM = 6371.0
+
+# Array padat yang diindeks langsung oleh zip prefix -> lookup O(1); NaN = tidak diketahui
+ZIP_LAT = None
+ZIP_LNG = None
+# Median distance_km training (param run) untuk request tanpa zip / zip tidak dikenal
+DISTANCE_KM_IMPUTED = None
+
+# Snapshot fitur online per produk/kategori (hasil etl_pipeline.py); diganti utuh saat refresh
+ONLINE_FEATURES_PRODUCTS_PREFIX = "online_features/products/"
+ONLINE_FEATURES_CATEGORIES_PREFIX = "online_features/categories/"
+ONLINE_FEATURES = None
+MAX_BATCH_ITEMS = 1000
+
+# Monitoring drift: profil referensi dari run training (train_model.py)
+DRIFT_REFERENCE_ARTIFACT = "drift_reference.json"
+DRIFT_WINDOW_SECONDS = int(os.getenv("DRIFT_WINDOW_SECONDS", "3600"))
+DRIFT_EVAL_INTERVAL_SECONDS = int(os.getenv("DRIFT_EVAL_INTERVAL_SECONDS", "30"))
+MONITOR = None
 
 class PredictionInput(BaseModel):
     cost_price: float
     freight_value: float
     delivery_days: float
     review_score: float
+    seller_zip_code_prefix: Optional[int] = None
+    customer_zip_code_prefix: Optional[int] = None
+    distance_km: Optional[float] = None
     
     class Config:
         json_schema_extra = {
@@ -23,18 +68,170 @@ class PredictionInput(BaseModel):
                 "cost_price": 50.0,
                 "freight_value": 15.5,
                 "delivery_days": 7.0,
-                "review_score": 4.2
+                "review_score": 4.2,
+                "seller_zip_code_prefix": 13023,
+                "customer_zip_code_prefix": 1037
             }
         }
 
 class PredictionOutput(BaseModel):
     predicted_price: float
     input_features: dict
+    prediction_interval: Optional[dict] = None  # p10/p50/p90 dari sebaran prediksi antar pohon
+
+class IdPredictionInput(BaseModel):
+    product_id: Optional[str] = None
+    product_category_name: Optional[str] = None
+    cost_price: Optional[float] = None  # default: median historis dari snapshot
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "product_id": "1e9e8ef04dbcff4541ed26657ea517e5",
+                "cost_price": 50.0
+            }
+        }
+
+class IdPredictionOutput(BaseModel):
+    product_id: Optional[str] = None
+    product_category_name: Optional[str] = None
+    predicted_price: Optional[float] = None
+    feature_source: Optional[str] = None  # 'product', 'category', atau None jika tidak ditemukan
+    input_features: Optional[dict] = None
+    prediction_interval: Optional[dict] = None
+
+class BatchIdPredictionInput(BaseModel):
+    items: List[IdPredictionInput]
+
+class BatchIdPredictionOutput(BaseModel):
+    predictions: List[IdPredictionOutput]
+
+def get_s3_client():
+    return boto3.client(
+        's3',
+        endpoint_url=MINIO_ENDPOINT,
+        aws_access_key_id=MINIO_ACCESS_KEY,
+        aws_secret_access_key=MINIO_SECRET_KEY,
+    )
+
+def read_gold_parquet(prefix):
+    """Baca snapshot terbaru tabel gold (manifest yang sudah di-commit) menjadi satu DataFrame"""
+    s3_client = get_s3_client()
+    return lake_table.load_snapshot(s3_client, GOLD_BUCKET, prefix).to_pandas(s3_client)
+
+def load_zip_centroids():
+    """Load centroid zip prefix dari MinIO ke array lat/lng padat"""
+    global ZIP_LAT, ZIP_LNG
+    centroids = read_gold_parquet(GEO_CENTROIDS_PREFIX)
+    centroids = centroids[(centroids['zip_code_prefix'] >= 0) & (centroids['zip_code_prefix'] < ZIP_PREFIX_SPACE)]
+
+    lat = np.full(ZIP_PREFIX_SPACE, np.nan)
+    lng = np.full(ZIP_PREFIX_SPACE, np.nan)
+    zips = centroids['zip_code_prefix'].to_numpy(dtype=np.int64)
+    lat[zips] = centroids['lat'].to_numpy()
+    lng[zips] = centroids['lng'].to_numpy()
+    ZIP_LAT, ZIP_LNG = lat, lng
+    return len(zips)
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Jarak great-circle (km), bekerja untuk skalar maupun array numpy"""
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def lookup_distance_km(seller_zip, customer_zip):
+    """Jarak seller -> customer dari zip prefix, None jika tidak bisa dihitung"""
+    if ZIP_LAT is None or seller_zip is None or customer_zip is None:
+        return None
+    if not (0 <= seller_zip < ZIP_PREFIX_SPACE and 0 <= customer_zip < ZIP_PREFIX_SPACE):
+        return None
+    distance = haversine_km(ZIP_LAT[seller_zip], ZIP_LNG[seller_zip], ZIP_LAT[customer_zip], ZIP_LNG[customer_zip])
+    return None if np.isnan(distance) else float(distance)
+
+def load_distance_imputation():
+    """Baca median distance_km training yang dicatat train_model.py pada run model"""
+    global DISTANCE_KM_IMPUTED
+    value = mlflow.get_run(RUN_ID).data.params.get("distance_km_imputed")
+    DISTANCE_KM_IMPUTED = float(value) if value is not None else None
+    return DISTANCE_KM_IMPUTED
+
+def load_online_features():
+    """Bangun snapshot fitur baru lalu tukar referensi global sekaligus (atomic swap)"""
+    global ONLINE_FEATURES
+    snapshot = OnlineFeatureSnapshot(
+        read_gold_parquet(ONLINE_FEATURES_PRODUCTS_PREFIX),
+        read_gold_parquet(ONLINE_FEATURES_CATEGORIES_PREFIX),
+    )
+    ONLINE_FEATURES = snapshot
+    return snapshot.stats()
+
+def load_drift_monitor():
+    """Buat monitor drift dengan profil referensi yang disimpan bersama run model"""
+    global MONITOR
+    reference_path = mlflow.artifacts.download_artifacts(run_id=RUN_ID, artifact_path=DRIFT_REFERENCE_ARTIFACT)
+    with open(reference_path) as f:
+        reference = json.load(f)
+    MONITOR = DriftMonitor(
+        reference,
+        run_id=RUN_ID,
+        window_seconds=DRIFT_WINDOW_SECONDS,
+        eval_interval_seconds=DRIFT_EVAL_INTERVAL_SECONDS,
+    )
+    return MONITOR.series
+
+def record_served(input_df, predictions):
+    """Update sketch drift dengan fitur yang dilayani; tidak pernah menggagalkan request"""
+    if MONITOR is None:
+        return
+    try:
+        values = {name: pd.to_numeric(input_df[name], errors='coerce').to_numpy() for name in input_df.columns}
+        values['predicted_price'] = np.asarray(predictions, dtype='float64')
+        if len(input_df) == 1:
+            values = {name: value[0] for name, value in values.items()}
+        MONITOR.observe(values)
+    except Exception as e:
+        print(f"⚠️ Drift monitor update failed: {e}")
+
+def load_forest(model_uri):
+    """Kompilasi random forest di balik model pyfunc untuk prediksi per pohon"""
+    global FOREST
+    raw_model = getattr(getattr(MODEL, '_model_impl', None), 'sklearn_model', None)
+    if raw_model is None:
+        raw_model = mlflow.sklearn.load_model(model_uri)
+    if not hasattr(raw_model, 'estimators_'):
+        raise ValueError(f"{type(raw_model).__name__} is not a tree ensemble")
+    FOREST = CompiledForest(raw_model)
+    return FOREST.n_trees
+
+def predict_frame(input_df, interval=False):
+    """Prediksi titik, dan opsional persentil antar pohon dalam satu pass vektor"""
+    if not interval:
+        return MODEL.predict(input_df), None
+    if FOREST is None:
+        raise HTTPException(status_code=503, detail="Prediction intervals not available for this model")
+    # Mean seluruh pohon identik dengan RandomForestRegressor.predict
+    mean, percentiles = FOREST.predict_with_quantiles(input_df.astype('float32').to_numpy(), DEFAULT_QUANTILES)
+    return mean, percentiles.T
+
+def format_interval(percentiles):
+    return {f"p{q}": round(float(v), 2) for q, v in zip(DEFAULT_QUANTILES, percentiles)}
+
+def build_model_input(cost_price, freight_value, delivery_days, review_score, distance_km=None):
+    """DataFrame input dengan kolom & tipe data persis seperti skema training"""
+    input_df = pd.DataFrame({
+        'cost_price': np.asarray(cost_price, dtype='float32'),
+        'freight_value': np.asarray(freight_value, dtype='float64'),
+        'delivery_days': np.asarray(delivery_days, dtype='float64'),
+        'review_score': [str(r) for r in review_score]  # Convert to string as expected by model
+    })
+    if 'distance_km' in MODEL_FEATURES:
+        input_df['distance_km'] = np.asarray(distance_km, dtype='float64')
+    return input_df[MODEL_FEATURES]
 
 @app.on_event("startup")
 async def load_model():
     """Load model on startup"""
-    global MODEL
+    global MODEL, MODEL_FEATURES
     try:
         # Set MLflow tracking URI
         mlflow.set_tracking_uri("file:///app/mlruns")
@@ -42,39 +239,84 @@ async def load_model():
         # Load model using run_id
         model_uri = f"runs:/{RUN_ID}/model"
         MODEL = mlflow.pyfunc.load_model(model_uri)
-        print(f"✅ Model loaded successfully from run: {RUN_ID}")
+        input_schema = MODEL.metadata.get_input_schema()
+        if input_schema is not None:
+            MODEL_FEATURES = input_schema.input_names()
+        print(f"✅ Model loaded successfully from run: {RUN_ID} (features: {MODEL_FEATURES})")
         
     except Exception as e:
         print(f"❌ Error loading model: {e}")
         raise e
 
+    try:
+        n_trees = load_forest(model_uri)
+        print(f"✅ Compiled {n_trees} trees for prediction intervals")
+    except Exception as e:
+        print(f"⚠️ Prediction intervals disabled: {e}")
+
+    try:
+        n_zips = load_zip_centroids()
+        print(f"✅ Loaded {n_zips} zip prefix centroids from {GOLD_BUCKET}/{GEO_CENTROIDS_PREFIX}")
+    except Exception as e:
+        print(f"⚠️ Zip centroids not available, distance feature disabled: {e}")
+
+    if 'distance_km' in MODEL_FEATURES:
+        try:
+            imputed = load_distance_imputation()
+            if imputed is None:
+                print(f"⚠️ Run {RUN_ID} has no distance_km_imputed param; requests without known zips will be rejected")
+            else:
+                print(f"✅ Missing distance_km will be imputed with training median {imputed:.1f} km")
+        except Exception as e:
+            print(f"⚠️ Distance imputation not available: {e}")
+
+    try:
+        stats = load_online_features()
+        print(f"✅ Loaded online feature snapshot: {stats}")
+    except Exception as e:
+        print(f"⚠️ Online feature snapshot not available, /predict/by-id disabled: {e}")
+
+    try:
+        series = load_drift_monitor()
+        print(f"✅ Drift monitor ready for: {series}")
+    except Exception as e:
+        print(f"⚠️ Drift reference not available for run {RUN_ID}, monitoring disabled: {e}")
+
 @app.post("/predict", response_model=PredictionOutput)
-async def predict(input_data: PredictionInput):
+async def predict(input_data: PredictionInput, interval: bool = False):
     """Make price prediction"""
     try:
         if MODEL is None:
             raise HTTPException(status_code=500, detail="Model not loaded")
         
+        distance_km = input_data.distance_km
+        if distance_km is None:
+            distance_km = lookup_distance_km(input_data.seller_zip_code_prefix, input_data.customer_zip_code_prefix)
+        distance_imputed = 'distance_km' in MODEL_FEATURES and distance_km is None
+        if distance_imputed:
+            if DISTANCE_KM_IMPUTED is None:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Model requires distance_km: provide distance_km or known seller/customer zip code prefixes"
+                )
+            distance_km = DISTANCE_KM_IMPUTED
+
         # Prepare input data matching training schema exactly
-        input_df = pd.DataFrame({
-            'cost_price': [float(input_data.cost_price)],
-            'freight_value': [float(input_data.freight_value)],
-            'delivery_days': [float(input_data.delivery_days)],
-            'review_score': [str(input_data.review_score)]  # Convert to string as expected by model
-        })
-        
-        # Convert columns to match training data types
-        input_df['cost_price'] = input_df['cost_price'].astype('float32')
-        input_df['freight_value'] = input_df['freight_value'].astype('float64')
-        input_df['delivery_days'] = input_df['delivery_days'].astype('float64')
-        input_df['review_score'] = input_df['review_score'].astype('str')
+        input_df = build_model_input(
+            [input_data.cost_price],
+            [input_data.freight_value],
+            [input_data.delivery_days],
+            [input_data.review_score],
+            [distance_km],
+        )
         
         print(f"📊 Input DataFrame:\n{input_df}")
         print(f"📊 DataFrame dtypes:\n{input_df.dtypes}")
         
         # Make prediction
-        prediction = MODEL.predict(input_df)
+        prediction, percentiles = predict_frame(input_df, interval)
         predicted_price = float(prediction[0])
+        record_served(input_df, prediction)
         
         print(f"🎯 Prediction: {predicted_price}")
         
@@ -84,14 +326,119 @@ async def predict(input_data: PredictionInput):
                 "cost_price": input_data.cost_price,
                 "freight_value": input_data.freight_value,
                 "delivery_days": input_data.delivery_days,
-                "review_score": input_data.review_score
-            }
+                "review_score": input_data.review_score,
+                "distance_km": round(distance_km, 2) if distance_km is not None else None,
+                "distance_km_imputed": distance_imputed
+            },
+            prediction_interval=format_interval(percentiles[0]) if percentiles is not None else None
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Prediction error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
 
+def predict_by_ids(items, interval=False):
+    """Resolve fitur dari snapshot online lalu prediksi seluruh batch dalam satu panggilan model"""
+    if MODEL is None:
+        raise HTTPException(status_code=500, detail="Model not loaded")
+    snapshot = ONLINE_FEATURES  # ambil referensi sekali; refresh tidak mengubah snapshot ini
+    if snapshot is None:
+        raise HTTPException(status_code=503, detail="Online feature snapshot not loaded")
+    if len(items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch too large (max {MAX_BATCH_ITEMS} items)")
+    for item in items:
+        if item.product_id is None and item.product_category_name is None:
+            raise HTTPException(status_code=400, detail="Each item needs product_id or product_category_name")
+
+    rows, sources = snapshot.resolve(
+        [item.product_id for item in items],
+        [item.product_category_name for item in items],
+    )
+    features = {name: rows[:, i].astype('float64') for i, name in enumerate(FEATURE_COLUMNS)}
+    cost_override = np.array([np.nan if item.cost_price is None else item.cost_price for item in items])
+    features['cost_price'] = np.where(np.isnan(cost_override), features['cost_price'], cost_override)
+    distance_imputed = np.isnan(features['distance_km']) & ('distance_km' in MODEL_FEATURES) & (DISTANCE_KM_IMPUTED is not None)
+    if distance_imputed.any():
+        features['distance_km'] = np.where(distance_imputed, DISTANCE_KM_IMPUTED, features['distance_km'])
+
+    required = [f for f in FEATURE_COLUMNS if f in MODEL_FEATURES]
+    resolved = np.array([source is not None for source in sources], dtype=bool)
+    scorable = resolved & ~np.any(np.isnan(np.column_stack([features[f] for f in required])), axis=1)
+    # review_score dikirim sebagai string seperti pada skema training
+    review_scores = np.round(features['review_score'], 1)
+
+    predictions = np.full(len(items), np.nan)
+    percentiles = np.full((len(items), len(DEFAULT_QUANTILES)), np.nan)
+    if scorable.any():
+        input_df = build_model_input(
+            features['cost_price'][scorable],
+            features['freight_value'][scorable],
+            features['delivery_days'][scorable],
+            review_scores[scorable],
+            features['distance_km'][scorable],
+        )
+        batch_predictions, batch_percentiles = predict_frame(input_df, interval)
+        predictions[scorable] = batch_predictions
+        if batch_percentiles is not None:
+            percentiles[scorable] = batch_percentiles
+        record_served(input_df, predictions[scorable])
+
+    results = []
+    for i, item in enumerate(items):
+        if not scorable[i]:
+            results.append(IdPredictionOutput(
+                product_id=item.product_id,
+                product_category_name=item.product_category_name,
+                feature_source=sources[i],
+            ))
+            continue
+        results.append(IdPredictionOutput(
+            product_id=item.product_id,
+            product_category_name=item.product_category_name,
+            predicted_price=round(float(predictions[i]), 2),
+            feature_source=sources[i],
+            input_features={
+                "cost_price": round(float(features['cost_price'][i]), 2),
+                "freight_value": round(float(features['freight_value'][i]), 2),
+                "delivery_days": float(features['delivery_days'][i]),
+                "review_score": float(review_scores[i]),
+                "distance_km": None if np.isnan(features['distance_km'][i]) else round(float(features['distance_km'][i]), 2),
+                "distance_km_imputed": bool(distance_imputed[i])
+            },
+            prediction_interval=format_interval(percentiles[i]) if interval else None
+        ))
+    return results
+
+@app.post("/predict/by-id", response_model=IdPredictionOutput)
+def predict_by_id(input_data: IdPredictionInput, interval: bool = False):
+    """Predict price using only product_id / category and the in-memory feature snapshot"""
+    result = predict_by_ids([input_data], interval)[0]
+    if result.predicted_price is None:
+        raise HTTPException(status_code=404, detail="No online features found for this product_id / category")
+    return result
+
+@app.post("/predict/by-id/batch", response_model=BatchIdPredictionOutput)
+def predict_by_id_batch(input_data: BatchIdPredictionInput, interval: bool = False):
+    """Batch version of /predict/by-id; unknown items are returned without predicted_price"""
+    return BatchIdPredictionOutput(predictions=predict_by_ids(input_data.items, interval))
+
+@app.post("/features/refresh")
+def refresh_online_features():
+    """Reload the online feature snapshot from the gold layer without downtime"""
+    try:
+        return {"status": "refreshed", **load_online_features()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Feature refresh error: {str(e)}")
+
+@app.get("/metrics/drift")
+def drift_metrics(force: bool = False):
+    """Drift scores (PSI) of served features and predictions against the training reference"""
+    if MONITOR is None:
+        raise HTTPException(status_code=503, detail="Drift monitor not available for this model run")
+    return MONITOR.report(force=force)
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -99,7 +446,11 @@ async def health_check():
     return {
         "status": "healthy",
         "model_status": model_status,
-        "run_id": RUN_ID
+        "run_id": RUN_ID,
+        "geo_lookup": "loaded" if ZIP_LAT is not None else "not_loaded",
+        "distance_km_imputed": DISTANCE_KM_IMPUTED,
+        "prediction_intervals": "available" if FOREST is not None else "not_available",
+        "online_features": ONLINE_FEATURES.stats() if ONLINE_FEATURES is not None else "not_loaded"
     }
 
 @app.get("/")
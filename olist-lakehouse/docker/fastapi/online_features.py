@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+
+# Kolom fitur yang diekspor etl_pipeline.py ke gold/online_features (median historis)
+FEATURE_COLUMNS = ['cost_price', 'freight_value', 'delivery_days', 'review_score', 'distance_km']
+
+def _encode_keys(keys):
+    return np.array([str(k).encode('utf-8') for k in keys], dtype=np.bytes_)
+
+class FeatureIndex:
+    """Index read-only: key string (array bytes terurut) -> baris matriks float32"""
+
+    def __init__(self, keys, values):
+        order = np.argsort(keys)
+        self.keys = keys[order]
+        self.values = values[order]
+
+    @classmethod
+    def from_frame(cls, df, key_column):
+        df = df[df[key_column].notna() & (df[key_column].astype(str) != '')]
+        values = np.column_stack([
+            pd.to_numeric(df[c], errors='coerce').to_numpy(dtype=np.float32) if c in df.columns
+            else np.full(len(df), np.nan, dtype=np.float32)
+            for c in FEATURE_COLUMNS
+        ]) if len(df) else np.empty((0, len(FEATURE_COLUMNS)), dtype=np.float32)
+        return cls(_encode_keys(df[key_column]), values)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def positions(self, keys):
+        """Posisi tiap key di index (vektor, binary search); -1 jika tidak ada"""
+        query = _encode_keys(keys)
+        if len(self.keys) == 0 or len(query) == 0:
+            return np.full(len(query), -1, dtype=np.int64)
+        pos = np.searchsorted(self.keys, query)
+        pos = np.minimum(pos, len(self.keys) - 1)
+        return np.where(self.keys[pos] == query, pos, -1)
+
+    def lookup(self, keys):
+        """Baris fitur untuk tiap key (NaN jika tidak ada) dan mask ditemukan"""
+        pos = self.positions(keys)
+        found = pos >= 0
+        rows = np.full((len(pos), len(FEATURE_COLUMNS)), np.nan, dtype=np.float32)
+        rows[found] = self.values[pos[found]]
+        return rows, found
+
+def _category_or_none(category):
+    return category if isinstance(category, str) and category != '' else None
+
+class OnlineFeatureSnapshot:
+    """Snapshot fitur per product_id dan per kategori; diganti utuh saat refresh (atomic swap)"""
+
+    def __init__(self, product_df, category_df):
+        self.products = FeatureIndex.from_frame(product_df, 'product_id')
+        # Kategori tiap produk, sejajar dengan self.products.keys, untuk fallback ke kategori
+        product_df = product_df[product_df['product_id'].notna()]
+        category_by_product = dict(zip(product_df['product_id'].astype(str), product_df['product_category_name']))
+        # None = kategori produk tidak diketahui (null/kosong di gold)
+        self.product_categories = np.array(
+            [_category_or_none(category_by_product.get(k.decode('utf-8'))) for k in self.products.keys], dtype=object
+        )
+        self.categories = FeatureIndex.from_frame(category_df, 'product_category_name')
+        # Default global (median dari median kategori) untuk fitur yang tetap kosong
+        self.defaults = np.nanmedian(self.categories.values, axis=0) if len(self.categories) \
+            else np.full(len(FEATURE_COLUMNS), np.nan, dtype=np.float32)
+        self.loaded_at = datetime.now(timezone.utc).isoformat()
+
+    def resolve(self, product_ids, categories):
+        """Fitur untuk batch item: produk -> kategori -> default global, semua vektor.
+
+        Mengembalikan (matriks fitur, sumber per item: 'product' / 'category' / None).
+        """
+        n_items = len(product_ids)
+        # "Tidak diberikan" dilacak dengan mask, bukan nilai pengganti yang bisa bentrok dengan data
+        product_given = np.array([p is not None for p in product_ids], dtype=bool)
+        product_pos = np.full(n_items, -1, dtype=np.int64)
+        if product_given.any():
+            product_pos[product_given] = self.products.positions([p for p in product_ids if p is not None])
+        product_found = product_pos >= 0
+
+        rows = np.full((n_items, len(FEATURE_COLUMNS)), np.nan, dtype=np.float32)
+        rows[product_found] = self.products.values[product_pos[product_found]]
+
+        # Kategori dari request, atau kategori produk yang ditemukan
+        known_categories = np.empty(n_items, dtype=object)
+        known_categories[:] = list(categories)
+        from_product = product_found & np.array([c is None for c in categories], dtype=bool)
+        known_categories[from_product] = self.product_categories[product_pos[from_product]]
+
+        category_given = np.array([c is not None for c in known_categories], dtype=bool)
+        category_rows = np.full((n_items, len(FEATURE_COLUMNS)), np.nan, dtype=np.float32)
+        category_found = np.zeros(n_items, dtype=bool)
+        if category_given.any():
+            category_rows[category_given], category_found[category_given] = \
+                self.categories.lookup(list(known_categories[category_given]))
+
+        rows = np.where(np.isnan(rows), category_rows, rows)
+        rows = np.where(np.isnan(rows), self.defaults, rows)
+
+        sources = np.where(product_found, 'product', np.where(category_found, 'category', None))
+        return rows, sources
+
+    def stats(self):
+        return {
+            "products": len(self.products),
+            "categories": len(self.categories),
+            "loaded_at": self.loaded_at,
+        }
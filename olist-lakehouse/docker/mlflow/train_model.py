@@ -5,9 +5,10 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_absolute_error, mean_squared_error
 import mlflow
 import mlflow.sklearn
+import logging
 import os
-import io
 import boto3
+import lake_table
 
 mlflow.set_tracking_uri("file:///app/mlruns")
 
@@ -23,37 +24,53 @@ s3_client = boto3.client(
 )
 
 gold_bucket_name = "gold"
-gold_prefix = "olist_features/"
+gold_table = "olist_features"
+# Pin versi snapshot gold untuk mereproduksi run training lama; kosong = snapshot terbaru
+gold_snapshot_version = os.getenv("GOLD_SNAPSHOT_VERSION") or None
 
-def load_data_from_minio():
+# Profil referensi untuk monitoring drift di FastAPI (lihat docker/fastapi/drift_monitor.py)
+DRIFT_REFERENCE_ARTIFACT = "drift_reference.json"
+DRIFT_REFERENCE_BINS = 10
+DRIFT_REFERENCE_QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+def load_data_from_minio(version=None):
+    """Baca satu snapshot tabel gold (terbaru atau versi yang di-pin) beserta nomor versinya"""
     try:
-        objects = s3_client.list_objects_v2(Bucket=gold_bucket_name, Prefix=gold_prefix)
-        parquet_files = [obj['Key'] for obj in objects.get('Contents', []) if obj['Key'].endswith('.parquet')]
-        
-        if not parquet_files:
-            raise FileNotFoundError(f"No parquet files found in MinIO bucket '{gold_bucket_name}' with prefix '{gold_prefix}'")
-        
-        all_dfs = []
-        for p_file_key in parquet_files:
-            print(f"Reading {p_file_key} from MinIO bucket {gold_bucket_name}...")
-            response = s3_client.get_object(Bucket=gold_bucket_name, Key=p_file_key)
-            file_content = response['Body'].read()
-            df_part = pd.read_parquet(io.BytesIO(file_content))
-            all_dfs.append(df_part)
-        
-        if not all_dfs:
-             raise FileNotFoundError("Could not read any parquet data from MinIO.")
-        
-        df = pd.concat(all_dfs, ignore_index=True)
+        snapshot = lake_table.load_snapshot(s3_client, gold_bucket_name, gold_table, version=version)
+        if not snapshot.files:
+            raise FileNotFoundError(f"Snapshot v{snapshot.version} of '{gold_bucket_name}/{gold_table}' has no data files")
 
-        print(f"✅ Loaded data from MinIO: s3a://{gold_bucket_name}/{gold_prefix}")
+        df = snapshot.to_pandas(s3_client)
+
+        print(f"✅ Loaded data from MinIO: s3a://{gold_bucket_name}/{gold_table} (snapshot v{snapshot.version})")
         print(f"📊 Data shape: {df.shape}")
         print(f"📊 Columns: {df.columns.tolist()}")
-        return df
+        return df, snapshot.version
     except Exception as e:
         print(f"❌ Error loading data from MinIO: {e}")
         raise
 
+def build_drift_reference(X, predictions):
+    """Profil distribusi tiap fitur & prediksi: batas bin desil, proporsi bin, dan kuantil"""
+    series = {col: pd.to_numeric(X[col], errors='coerce').to_numpy(dtype=float) for col in X.columns}
+    series['predicted_price'] = np.asarray(predictions, dtype=float)
+
+    reference = {}
+    for name, values in series.items():
+        values = values[~np.isnan(values)]
+        inner_edges = np.unique(np.quantile(values, np.linspace(0, 1, DRIFT_REFERENCE_BINS + 1)[1:-1]))
+        counts = np.bincount(np.searchsorted(inner_edges, values, side='right'), minlength=len(inner_edges) + 1)
+        reference[name] = {
+            "count": int(len(values)),
+            "min": float(values.min()),
+            "max": float(values.max()),
+            "mean": float(values.mean()),
+            "bin_edges": inner_edges.tolist(),
+            "bin_fractions": (counts / counts.sum()).tolist(),
+            "quantiles": {str(q): float(np.quantile(values, q)) for q in DRIFT_REFERENCE_QUANTILES},
+        }
+    return reference
+
 def train_model():
     """Train ML model for price prediction"""
     mlflow.set_experiment("olist-price-prediction")
@@ -61,7 +78,9 @@ def train_model():
     with mlflow.start_run() as run:
         print("🚀 Starting model training...")
         
-        df = load_data_from_minio()
+        df, snapshot_version = load_data_from_minio(gold_snapshot_version)
+        mlflow.log_param("gold_table", f"{gold_bucket_name}/{gold_table}")
+        mlflow.log_param("gold_snapshot_version", snapshot_version)
         
         print("🔧 Preprocessing data...")
         df = df.dropna()
@@ -92,7 +111,7 @@ def train_model():
 
         print(f"📊 Data after cleaning: {df.shape}")
         
-        potential_features = ['cost_price', 'freight_value', 'delivery_days', 'review_score']
+        potential_features = ['cost_price', 'freight_value', 'delivery_days', 'review_score', 'distance_km']
         available_features = [col for col in potential_features if col in df.columns]
         
         print(f"Using features: {available_features}")
@@ -132,11 +151,18 @@ def train_model():
         mlflow.log_param("n_estimators", 50)
         mlflow.log_param("max_depth", 10)
         mlflow.log_param("features", available_features)
+        if 'distance_km' in available_features:
+            # Dipakai FastAPI saat zip seller/customer tidak diberikan atau tidak dikenal
+            mlflow.log_param("distance_km_imputed", round(float(X_train['distance_km'].median()), 3))
         
         mlflow.log_metric("train_mae", train_mae)
         mlflow.log_metric("test_mae", test_mae)
         mlflow.log_metric("train_rmse", train_rmse)
         mlflow.log_metric("test_rmse", test_rmse)
+
+        # Referensi dari data held-out: prediksi di data training terlalu pas (overfit) untuk baseline
+        mlflow.log_dict(build_drift_reference(X_test, test_pred), DRIFT_REFERENCE_ARTIFACT)
+        print(f"📐 Drift reference profile logged as {DRIFT_REFERENCE_ARTIFACT}")
         
         if not X_train.empty:
             mlflow.sklearn.log_model(
@@ -154,6 +180,7 @@ def train_model():
         return run_id
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
     try:
         run_id = train_model()
         print(f"✅ Training completed successfully!")
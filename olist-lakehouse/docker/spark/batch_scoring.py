@@ -0,0 +1,148 @@
+from pyspark.sql.functions import col, lit, struct, current_timestamp, to_date
+import mlflow
+import mlflow.pyfunc
+import argparse
+import logging
+import boto3
+import time
+import os
+import lake_table
+from spark_session import create_spark_session, session_conf, minio_endpoint, minio_access_key, minio_secret_key
+
+s3_client = boto3.client(
+    's3',
+    endpoint_url=minio_endpoint,
+    aws_access_key_id=minio_access_key,
+    aws_secret_access_key=minio_secret_key,
+)
+
+# Tabel sumber (bucket, tabel manifest) dan tabel hasil
+SOURCES = {
+    "gold": ("gold", "olist_features"),
+    "silver": ("silver", "olist_cleaned"),
+}
+PREDICTIONS_BUCKET = "gold"
+PREDICTIONS_TABLE = "predictions"
+PARTITION_COLUMNS = ["model_run_id", "scored_date"]
+EXPERIMENT_NAME = "olist-price-prediction"
+# Kolom identitas yang ikut disimpan bersama prediksi (jika ada di sumber)
+KEY_COLUMNS = ["order_id", "product_id", "seller_id", "product_category_name"]
+# Tipe kolom sesuai skema training (lihat train_model.py)
+FEATURE_TYPES = {
+    "cost_price": "float",
+    "freight_value": "double",
+    "delivery_days": "double",
+    "review_score": "string",
+    "distance_km": "double",
+}
+
+parser = argparse.ArgumentParser(description="Bulk scoring Olist price model ke gold/predictions")
+parser.add_argument("--run-id", default=os.getenv("SCORING_RUN_ID"),
+                    help="MLflow run ID model; default run terbaru di eksperimen olist-price-prediction")
+parser.add_argument("--source", choices=sorted(SOURCES), default=os.getenv("SCORING_SOURCE", "gold"))
+parser.add_argument("--source-version", type=int, default=os.getenv("SCORING_SOURCE_VERSION"),
+                    help="Versi snapshot tabel sumber (pinned); default snapshot terbaru")
+parser.add_argument("--batch-size", type=int, default=int(os.getenv("SCORING_BATCH_SIZE", "10000")),
+                    help="Jumlah baris per Arrow batch yang dikirim ke model")
+
+mlflow.set_tracking_uri(os.getenv("MLFLOW_TRACKING_URI", "file:///app/mlruns"))
+
+def resolve_run_id(run_id):
+    """Pakai run ID yang diberikan, atau run terbaru yang selesai di eksperimen training."""
+    if run_id:
+        return run_id
+    runs = mlflow.search_runs(
+        experiment_names=[EXPERIMENT_NAME],
+        filter_string="attributes.status = 'FINISHED'",
+        order_by=["attributes.start_time DESC"],
+        max_results=1,
+    )
+    if runs.empty:
+        raise ValueError(f"No finished runs found in MLflow experiment '{EXPERIMENT_NAME}'")
+    return runs.iloc[0]["run_id"]
+
+def run_batch_scoring(spark, run_id=None, source="gold", source_version=None, batch_size=10000):
+    """Scoring seluruh tabel sumber ke gold/predictions memakai SparkSession yang diberikan"""
+    if source not in SOURCES:
+        raise ValueError(f"Unknown source '{source}'; available: {sorted(SOURCES)}")
+    # Konfigurasi Arrow hanya berlaku selama job ini, agar tidak bocor ke job berikutnya di runner
+    with session_conf(spark, {
+        "spark.sql.execution.arrow.pyspark.enabled": "true",
+        "spark.sql.execution.arrow.maxRecordsPerBatch": str(batch_size),
+    }):
+        return _score_source(spark, run_id, source, source_version)
+
+def _score_source(spark, run_id, source, source_version):
+    run_id = resolve_run_id(run_id)
+    model_uri = f"runs:/{run_id}/model"
+    features = mlflow.models.get_model_info(model_uri).signature.inputs.input_names()
+    print(f"Scoring with model {model_uri} (features: {features})")
+
+    # spark_udf menyalin artefak model ke executor dan me-load model sekali per Python worker;
+    # prediksi dilakukan per Arrow batch (pandas), bukan per baris
+    predict_udf = mlflow.pyfunc.spark_udf(spark, model_uri, result_type="double", env_manager="local")
+
+    source_bucket, source_table = SOURCES[source]
+    source_snapshot = lake_table.load_snapshot(s3_client, source_bucket, source_table, version=source_version)
+    source_name = f"{source_bucket}/{source_table} v{source_snapshot.version}"
+    print(f"Loading features from {source_name} ({len(source_snapshot.files)} files, {source_snapshot.row_count} rows)...")
+    df = source_snapshot.read_spark(spark)
+
+    missing = [f for f in features if f not in df.columns]
+    if missing:
+        raise ValueError(f"Source {source_name} is missing model features: {missing}")
+
+    df = df.dropna(subset=features)
+    for feature in features:
+        df = df.withColumn(feature, col(feature).cast(FEATURE_TYPES.get(feature, "double")))
+
+    key_columns = [c for c in KEY_COLUMNS if c in df.columns]
+    predictions = df.select(
+        *key_columns,
+        predict_udf(struct(*[col(f) for f in features])).alias("predicted_price"),
+        lit(run_id).alias("model_run_id"),
+        current_timestamp().alias("scored_at"),
+    ).withColumn("scored_date", to_date("scored_at"))
+
+    cores = spark.sparkContext.defaultParallelism
+    n_rows = df.count()
+
+    print(f"Writing {n_rows} predictions to {PREDICTIONS_BUCKET}/{PREDICTIONS_TABLE}...")
+    start = time.perf_counter()
+    # Hanya partisi (model_run_id, scored_date) yang ditulis ulang yang diganti; partisi lain tetap
+    snapshot = lake_table.write_spark_table(
+        predictions, s3_client, PREDICTIONS_BUCKET, PREDICTIONS_TABLE,
+        mode="replace_partitions", partition_by=PARTITION_COLUMNS,
+    )
+    elapsed = time.perf_counter() - start
+
+    rows_per_sec = n_rows / elapsed if elapsed > 0 else float("inf")
+    print(f"Predictions saved to gold layer: {PREDICTIONS_BUCKET}/{PREDICTIONS_TABLE} v{snapshot.version} "
+          f"(source {source_name})")
+    print(f"Throughput: {n_rows} rows in {elapsed:.2f}s on {cores} cores "
+          f"= {rows_per_sec:,.0f} rows/s ({rows_per_sec / cores:,.0f} rows/s/core)")
+
+    print("Batch scoring selesai.")
+    return {
+        "model_run_id": run_id,
+        "source": source_name,
+        "predictions_version": snapshot.version,
+        "rows": n_rows,
+        "rows_per_sec": round(rows_per_sec, 1),
+    }
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    args = parser.parse_args()
+    spark = create_spark_session("OlistBatchScoring")
+
+    try:
+        run_batch_scoring(spark, args.run_id, args.source, args.source_version, args.batch_size)
+
+    except Exception as e:
+        print(f"Error occurred: {str(e)}")
+        import traceback
+        traceback.print_exc() # Cetak traceback untuk debug lebih detail
+        raise e
+    finally:
+        spark.stop()
@@ -1,11 +1,20 @@
-from pyspark.sql import SparkSession
-from pyspark.sql.functions import col, to_date, datediff, rand
+from pyspark.sql.functions import col, to_date, datediff, rand, avg, count, broadcast, radians, sin, cos, asin, sqrt, pow, lit, percentile_approx
+from pyspark.sql.utils import AnalysisException
+import argparse
+import logging
+import boto3
+import time
 import os
+import lake_table
+from spark_session import create_spark_session, warm_up_s3a, minio_endpoint, minio_access_key, minio_secret_key
 
-# Ambil konfigurasi MinIO dari environment variables
-minio_endpoint = os.getenv("MINIO_ENDPOINT", "http://minio:9000")
-minio_access_key = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
-minio_secret_key = os.getenv("MINIO_SECRET_KEY", "minioadmin")
+# Client S3 untuk commit manifest tabel silver/gold (lihat docker/common/lake_table.py)
+s3_client = boto3.client(
+    's3',
+    endpoint_url=minio_endpoint,
+    aws_access_key_id=minio_access_key,
+    aws_secret_access_key=minio_secret_key,
+)
 
 # Path S3A untuk bucket
 raw_bucket = "s3a://raw"
@@ -13,48 +22,95 @@ bronze_bucket = "s3a://bronze"
 silver_bucket = "s3a://silver"
 gold_bucket = "s3a://gold"
 
-# Inisialisasi SparkSession dengan konfigurasi S3A untuk MinIO
-spark_builder = SparkSession.builder \
-    .appName("OlistETL") \
-    .config("spark.sql.adaptive.enabled", "true") \
-    .config("spark.sql.adaptive.coalescePartitions.enabled", "true") \
-    .config("spark.hadoop.fs.s3a.endpoint", minio_endpoint) \
-    .config("spark.hadoop.fs.s3a.access.key", minio_access_key) \
-    .config("spark.hadoop.fs.s3a.secret.key", minio_secret_key) \
-    .config("spark.hadoop.fs.s3a.path.style.access", "true") \
-    .config("spark.hadoop.fs.s3a.impl", "org.apache.hadoop.fs.s3a.S3AFileSystem") \
-    .config("spark.jars.packages", "org.apache.hadoop:hadoop-aws:3.3.4,com.amazonaws:aws-java-sdk-bundle:1.12.262") # Versi bisa disesuaikan
-
-spark = spark_builder.getOrCreate()
-
-# Hapus os.makedirs dan chmod, MinIO akan handle ini.
-
-try:
-    # Load data dari raw layer (MinIO bucket 'raw')
+# Prefix Parquet hasil landing transform streamer (raw/<prefix>/<nama_tabel>.parquet)
+raw_parquet_prefix = os.getenv("RAW_PARQUET_PREFIX", "parquet")
+
+# Tabel raw yang disalin ke bronze: nama di bronze -> nama tabel raw
+BRONZE_TABLES = {
+    "orders": "olist_orders_dataset",
+    "items": "olist_order_items_dataset",
+    "products": "olist_products_dataset",
+    "reviews": "olist_order_reviews_dataset",
+}
+
+# Bounding box Brasil untuk membuang titik geolocation yang jelas salah
+BRAZIL_LAT_RANGE = (-33.75, 5.27)
+BRAZIL_LNG_RANGE = (-73.99, -34.79)
+EARTH_RADIUS_KM = 6371.0
+
+# Fitur yang di-snapshot per produk/kategori untuk lookup online di FastAPI (median historis)
+ONLINE_FEATURES = ["cost_price", "freight_value", "delivery_days", "review_score", "distance_km"]
+
+def read_raw_table(spark, name):
+    """Baca tabel raw dari Parquet hasil landing jika ada, fallback ke CSV."""
+    try:
+        df = spark.read.parquet(f"{raw_bucket}/{raw_parquet_prefix}/{name}.parquet")
+        print(f"  {name}: read landed Parquet")
+        return df
+    except AnalysisException:
+        print(f"  {name}: no landed Parquet, reading CSV with schema inference")
+        return spark.read.csv(f"{raw_bucket}/{name}.csv", header=True, inferSchema=True)
+
+def read_table(spark, bucket, table):
+    """Baca snapshot terbaru tabel manifest (silver/gold) sebagai DataFrame Spark."""
+    snapshot = lake_table.load_snapshot(s3_client, bucket, table)
+    print(f"  {bucket}/{table}: snapshot v{snapshot.version} ({len(snapshot.files)} files)")
+    return snapshot.read_spark(spark)
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Ekspresi kolom Spark untuk jarak great-circle (km), dievaluasi vektor per batch."""
+    dlat = radians(lat2 - lat1)
+    dlng = radians(lng2 - lng1)
+    a = pow(sin(dlat / 2), 2) + cos(radians(lat1)) * cos(radians(lat2)) * pow(sin(dlng / 2), 2)
+    return lit(2 * EARTH_RADIUS_KM) * asin(sqrt(a))
+
+# === BRONZE LAYER === #
+def stage_bronze(spark):
     print(f"Loading data from raw layer: {raw_bucket}...")
-    orders = spark.read.csv(f"{raw_bucket}/olist_orders_dataset.csv", header=True, inferSchema=True)
-    items = spark.read.csv(f"{raw_bucket}/olist_order_items_dataset.csv", header=True, inferSchema=True)
-    products = spark.read.csv(f"{raw_bucket}/olist_products_dataset.csv", header=True, inferSchema=True)
-    reviews = spark.read.csv(f"{raw_bucket}/olist_order_reviews_dataset.csv", header=True, inferSchema=True)
-
     print(f"Saving to bronze layer: {bronze_bucket}...")
-    orders.coalesce(1).write.mode("overwrite").parquet(f"{bronze_bucket}/orders")
-    print("Orders saved to bronze layer")
-    
-    items.coalesce(1).write.mode("overwrite").parquet(f"{bronze_bucket}/items")
-    print("Items saved to bronze layer")
-    
-    products.coalesce(1).write.mode("overwrite").parquet(f"{bronze_bucket}/products")
-    print("Products saved to bronze layer")
-    
-    reviews.coalesce(1).write.mode("overwrite").parquet(f"{bronze_bucket}/reviews")
-    print("Reviews saved to bronze layer")
-
-    # === SILVER LAYER === #
+    for bronze_name, raw_name in BRONZE_TABLES.items():
+        read_raw_table(spark, raw_name).coalesce(1).write.mode("overwrite").parquet(f"{bronze_bucket}/{bronze_name}")
+        print(f"{bronze_name.capitalize()} saved to bronze layer")
+
+# === GEO LOOKUP (GOLD) === #
+def stage_geo(spark):
+    # ~1M baris geolocation -> satu centroid per zip prefix (~19K baris)
+    print(f"Building zip-prefix centroids to {gold_bucket}/geo_zip_centroids...")
+    geolocation = read_raw_table(spark, "olist_geolocation_dataset")
+    zip_centroids = geolocation \
+        .filter(col("geolocation_lat").between(*BRAZIL_LAT_RANGE) & col("geolocation_lng").between(*BRAZIL_LNG_RANGE)) \
+        .groupBy(col("geolocation_zip_code_prefix").cast("int").alias("zip_code_prefix")) \
+        .agg(avg("geolocation_lat").alias("lat"), avg("geolocation_lng").alias("lng"), count("*").alias("n_points"))
+
+    snapshot = lake_table.write_spark_table(zip_centroids.coalesce(1), s3_client, "gold", "geo_zip_centroids")
+    print(f"Zip centroids saved to gold layer ({snapshot.row_count} prefixes)")
+
+# === SILVER LAYER === #
+def stage_silver(spark):
     print(f"Processing silver layer to {silver_bucket}...")
+    orders, items, products, reviews = [
+        spark.read.parquet(f"{bronze_bucket}/{name}") for name in BRONZE_TABLES
+    ]
+    sellers = read_raw_table(spark, "olist_sellers_dataset")
+    customers = read_raw_table(spark, "olist_customers_dataset")
+    zip_centroids = read_table(spark, "gold", "geo_zip_centroids")
+
+    seller_geo = broadcast(zip_centroids.select(
+        col("zip_code_prefix").alias("seller_zip_code_prefix"), col("lat").alias("seller_lat"), col("lng").alias("seller_lng")
+    ))
+    customer_geo = broadcast(zip_centroids.select(
+        col("zip_code_prefix").alias("customer_zip_code_prefix"), col("lat").alias("customer_lat"), col("lng").alias("customer_lng")
+    ))
+
     df = orders.join(items, on="order_id", how="inner") \
                .join(products, on="product_id", how="left") \
-               .join(reviews, on="order_id", how="left")
+               .join(reviews, on="order_id", how="left") \
+               .join(sellers.select("seller_id", col("seller_zip_code_prefix").cast("int")), on="seller_id", how="left") \
+               .join(customers.select("customer_id", col("customer_zip_code_prefix").cast("int")), on="customer_id", how="left") \
+               .join(seller_geo, on="seller_zip_code_prefix", how="left") \
+               .join(customer_geo, on="customer_zip_code_prefix", how="left")
+
+    df = df.withColumn("distance_km", haversine_km(col("seller_lat"), col("seller_lng"), col("customer_lat"), col("customer_lng")))
 
     df = df.withColumn("order_approved_at", to_date("order_approved_at")) \
            .withColumn("order_delivered_customer_date", to_date("order_delivered_customer_date")) \
@@ -68,24 +124,92 @@ try:
     df = df.withColumn("cost_price_ratio", (rand() * 0.3 + 0.5)) # Untuk inspeksi jika perlu
     df = df.withColumn("cost_price", (col("price") * col("cost_price_ratio")).cast("float"))
 
-    df.coalesce(1).write.mode("overwrite").parquet(f"{silver_bucket}/olist_cleaned")
+    lake_table.write_spark_table(df.coalesce(1), s3_client, "silver", "olist_cleaned")
     print("Data saved to silver layer")
 
-    # === GOLD LAYER === #
+# === GOLD LAYER === #
+def stage_gold(spark):
     print(f"Processing gold layer to {gold_bucket}...")
-    gold_df = df.select(
-        "cost_price", "freight_value", "price", "delivery_days", "review_score", "product_category_name"
+    gold_df = read_table(spark, "silver", "olist_cleaned").select(
+        "order_id", "product_id", "seller_id",
+        "cost_price", "freight_value", "price", "delivery_days", "review_score", "product_category_name",
+        "seller_zip_code_prefix", "customer_zip_code_prefix", "distance_km"
     )
 
-    gold_df.coalesce(1).write.mode("overwrite").parquet(f"{gold_bucket}/olist_features") # direktori, bukan file
-    print("Features saved to gold layer")
-
+    features_snapshot = lake_table.write_spark_table(gold_df.coalesce(1), s3_client, "gold", "olist_features")
+    print(f"Features saved to gold layer (snapshot v{features_snapshot.version})")
+
+# === ONLINE FEATURE SNAPSHOT (GOLD) === #
+def stage_online_features(spark):
+    # Dibaca dari snapshot gold agar konsisten dengan data training (cost_price memakai rand())
+    print(f"Exporting online feature snapshot to {gold_bucket}/online_features...")
+    gold_saved = read_table(spark, "gold", "olist_features") \
+        .filter(col("delivery_days").isNull() | col("delivery_days").between(0, 100))
+    online_aggs = [percentile_approx(col(c).cast("double"), 0.5).alias(c) for c in ONLINE_FEATURES] + \
+        [count("*").alias("n_orders")]
+
+    product_features = gold_saved.filter(col("product_id").isNotNull()) \
+        .groupBy("product_id", "product_category_name").agg(*online_aggs)
+    lake_table.write_spark_table(product_features.coalesce(1), s3_client, "gold", "online_features/products")
+
+    # Kategori null/kosong bukan kategori nyata: jangan jadi grup fallback di lookup online
+    category_features = gold_saved.filter(col("product_category_name").isNotNull() & (col("product_category_name") != "")) \
+        .groupBy("product_category_name").agg(*online_aggs)
+    lake_table.write_spark_table(category_features.coalesce(1), s3_client, "gold", "online_features/categories")
+    print("Online feature snapshot saved to gold layer")
+
+# Urutan stage pipeline; tiap stage membaca input dari output stage sebelumnya di lake
+STAGES = {
+    "bronze": stage_bronze,
+    "geo": stage_geo,
+    "silver": stage_silver,
+    "gold": stage_gold,
+    "online_features": stage_online_features,
+}
+
+def resolve_stages(stages=None):
+    """Stage yang dijalankan, selalu dalam urutan pipeline; None = semua"""
+    if not stages:
+        return list(STAGES)
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown ETL stages {unknown}; available: {list(STAGES)}")
+    return [s for s in STAGES if s in stages]
+
+def run_pipeline(spark, stages=None):
+    """Jalankan stage ETL pada SparkSession yang diberikan; kembalikan durasi per stage (detik)"""
+    timings = []
+    for name in resolve_stages(stages):
+        start = time.perf_counter()
+        STAGES[name](spark)
+        timings.append({"stage": name, "seconds": round(time.perf_counter() - start, 3)})
     print("ETL selesai.")
-
-except Exception as e:
-    print(f"Error occurred: {str(e)}")
-    import traceback
-    traceback.print_exc() # Cetak traceback untuk debug lebih detail
-    raise e
-finally:
-    spark.stop()
\ No newline at end of file
+    return timings
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    parser = argparse.ArgumentParser(description="Olist ETL raw -> bronze -> silver -> gold")
+    parser.add_argument("--stages", default=os.getenv("ETL_STAGES"),
+                        help=f"Stage dipisah koma (default semua): {','.join(STAGES)}")
+    args = parser.parse_args()
+    stages = resolve_stages(args.stages.split(",") if args.stages else None)
+
+    start = time.perf_counter()
+    spark = create_spark_session("OlistETL")
+    warm_up_s3a(spark)
+    startup_seconds = time.perf_counter() - start
+
+    try:
+        start = time.perf_counter()
+        timings = run_pipeline(spark, stages)
+        compute_seconds = time.perf_counter() - start
+        print(f"Startup {startup_seconds:.1f}s (SparkSession + S3A), compute {compute_seconds:.1f}s: "
+              + ", ".join(f"{t['stage']} {t['seconds']:.1f}s" for t in timings))
+
+    except Exception as e:
+        print(f"Error occurred: {str(e)}")
+        import traceback
+        traceback.print_exc() # Cetak traceback untuk debug lebih detail
+        raise e
+    finally:
+        spark.stop()
@@ -0,0 +1,238 @@
+"""Runner ETL dengan satu SparkSession yang tetap hangat.
+
+Setiap `spark-submit` baru membayar start JVM, pemuatan jar S3A, dan inisialisasi
+S3AFileSystem. Runner ini membuat session sekali saat start, lalu menjalankan pipeline
+(atau stage tertentu) dan batch scoring di session yang sama lewat HTTP lokal.
+
+Runner di-start otomatis oleh service `etl-runner` di docker-compose (`etl_runner.py serve`).
+
+Contoh:
+    docker-compose exec etl-runner python /app/etl_runner.py run
+    docker-compose exec etl-runner python /app/etl_runner.py run --stages gold,online_features
+    docker-compose exec etl-runner python /app/etl_runner.py run --job score --run-id <RUN_ID>
+    docker-compose exec etl-runner python /app/etl_runner.py status
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from collections import deque
+from datetime import datetime, timezone
+import urllib.request
+import urllib.error
+import traceback
+import threading
+import argparse
+import logging
+import json
+import time
+import os
+import etl_pipeline
+import batch_scoring
+from spark_session import create_spark_session, warm_up_s3a, s3a_jars_available
+
+# Hanya listen di localhost: trigger lokal dari dalam container, tanpa autentikasi
+RUNNER_HOST = os.getenv("ETL_RUNNER_HOST", "127.0.0.1")
+RUNNER_PORT = int(os.getenv("ETL_RUNNER_PORT", "8090"))
+RUN_HISTORY_SIZE = 50
+
+class RunnerBusyError(RuntimeError):
+    pass
+
+def _run_etl(spark, params):
+    return {"stages": etl_pipeline.run_pipeline(spark, params.get("stages"))}
+
+def _run_scoring(spark, params):
+    return batch_scoring.run_batch_scoring(
+        spark,
+        run_id=params.get("run_id"),
+        source=params.get("source", "gold"),
+        source_version=params.get("source_version"),
+        batch_size=int(params.get("batch_size", 10000)),
+    )
+
+JOBS = {
+    "etl": _run_etl,
+    "score": _run_scoring,
+}
+
+class WarmSparkRunner:
+    """Memegang SparkSession hangat dan menjalankan job satu per satu di atasnya"""
+
+    def __init__(self):
+        self.spark = None
+        self.session_startup_seconds = None
+        self.sessions_created = 0
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.history = deque(maxlen=RUN_HISTORY_SIZE)
+        self.runs_total = 0
+        self._lock = threading.Lock()
+
+    def _session_alive(self):
+        return self.spark is not None and not self.spark.sparkContext._jsc.sc().isStopped()
+
+    def ensure_session(self):
+        """Buat session (dan S3A) jika belum ada/mati; kembalikan detik yang dihabiskan (0 jika dipakai ulang)"""
+        if self._session_alive():
+            return 0.0
+        start = time.perf_counter()
+        self.spark = create_spark_session("OlistETLRunner")
+        warm_up_s3a(self.spark)
+        self.session_startup_seconds = round(time.perf_counter() - start, 3)
+        self.sessions_created += 1
+        print(f"SparkSession ready in {self.session_startup_seconds:.1f}s "
+              f"(offline S3A jars: {s3a_jars_available()}, app id {self.spark.sparkContext.applicationId})")
+        return self.session_startup_seconds
+
+    def run(self, job, params):
+        if job not in JOBS:
+            raise ValueError(f"Unknown job '{job}'; available: {sorted(JOBS)}")
+        if job == "etl":
+            stages = params.get("stages")
+            params["stages"] = etl_pipeline.resolve_stages(stages.split(",") if isinstance(stages, str) else stages)
+        if not self._lock.acquire(blocking=False):
+            raise RunnerBusyError("Another run is in progress")
+        try:
+            self.runs_total += 1
+            record = {
+                "run_number": self.runs_total,
+                "job": job,
+                "params": params,
+                "started_at": datetime.now(timezone.utc).isoformat(),
+            }
+            wall_start = time.perf_counter()
+            startup_seconds = self.ensure_session()
+            compute_start = time.perf_counter()
+            try:
+                record["result"] = JOBS[job](self.spark, params)
+                record["status"] = "succeeded"
+            except Exception as e:
+                traceback.print_exc()
+                record["status"] = "failed"
+                record["error"] = str(e)
+            finally:
+                if self._session_alive():
+                    self.spark.catalog.clearCache()  # jangan bawa cache antar run
+            record.update({
+                "startup_seconds": round(startup_seconds, 3),
+                "compute_seconds": round(time.perf_counter() - compute_start, 3),
+                "wall_seconds": round(time.perf_counter() - wall_start, 3),
+                "session_reused": startup_seconds == 0.0,
+            })
+            self.history.append(record)
+            print(f"Run #{record['run_number']} {job} {record['status']}: startup {record['startup_seconds']:.1f}s, "
+                  f"compute {record['compute_seconds']:.1f}s")
+            return record
+        finally:
+            self._lock.release()
+
+    def status(self):
+        return {
+            "status": "ok" if self._session_alive() else "no_session",
+            "busy": self._lock.locked(),
+            "started_at": self.started_at,
+            "session": {
+                "app_id": self.spark.sparkContext.applicationId if self._session_alive() else None,
+                "startup_seconds": self.session_startup_seconds,
+                "sessions_created": self.sessions_created,
+                "offline_s3a_jars": s3a_jars_available(),
+            },
+            "runs_total": self.runs_total,
+            "last_run": self.history[-1] if self.history else None,
+        }
+
+def make_handler(runner):
+    class RunnerHandler(BaseHTTPRequestHandler):
+        def _send(self, status, payload):
+            body = json.dumps(payload, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, runner.status())
+            elif self.path == "/runs":
+                self._send(200, list(runner.history))
+            else:
+                self._send(404, {"detail": "Not found"})
+
+        def do_POST(self):
+            if self.path != "/run":
+                self._send(404, {"detail": "Not found"})
+                return
+            try:
+                params = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                job = params.pop("job", "etl")
+                record = runner.run(job, params)
+            except RunnerBusyError as e:
+                self._send(409, {"detail": str(e)})
+            except (ValueError, TypeError) as e:
+                self._send(400, {"detail": str(e)})
+            except Exception as e:
+                traceback.print_exc()
+                self._send(500, {"detail": str(e)})
+            else:
+                self._send(200 if record["status"] == "succeeded" else 500, record)
+
+    return RunnerHandler
+
+def serve():
+    runner = WarmSparkRunner()
+    runner.ensure_session()
+    server = ThreadingHTTPServer((RUNNER_HOST, RUNNER_PORT), make_handler(runner))
+    print(f"ETL runner listening on http://{RUNNER_HOST}:{RUNNER_PORT} (jobs: {sorted(JOBS)}, stages: {list(etl_pipeline.STAGES)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping ETL runner...")
+    finally:
+        server.server_close()
+        if runner.spark is not None:
+            runner.spark.stop()
+
+def request_runner(method, path, payload=None):
+    """Kirim request ke runner lokal; kembalikan (status HTTP, body JSON)"""
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(f"http://127.0.0.1:{RUNNER_PORT}{path}", data=data, method=method,
+                                 headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"{}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    parser = argparse.ArgumentParser(description="Runner ETL dengan SparkSession hangat")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("serve", help="Start runner (membuat SparkSession sekali)")
+    subparsers.add_parser("status", help="Status session dan run terakhir")
+    run_parser = subparsers.add_parser("run", help="Trigger satu run di runner yang sedang berjalan")
+    run_parser.add_argument("--job", choices=sorted(JOBS), default="etl")
+    run_parser.add_argument("--stages", help=f"Stage ETL dipisah koma (default semua): {','.join(etl_pipeline.STAGES)}")
+    run_parser.add_argument("--run-id", help="Job score: MLflow run ID model")
+    run_parser.add_argument("--source", help="Job score: tabel sumber (gold/silver)")
+    run_parser.add_argument("--source-version", type=int, help="Job score: versi snapshot sumber")
+    run_parser.add_argument("--batch-size", type=int, help="Job score: baris per Arrow batch")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve()
+    else:
+        try:
+            if args.command == "status":
+                status, body = request_runner("GET", "/health")
+            else:
+                payload = {"job": args.job}
+                if args.stages:
+                    payload["stages"] = args.stages.split(",")
+                for name in ("run_id", "source", "source_version", "batch_size"):
+                    if getattr(args, name) is not None:
+                        payload[name] = getattr(args, name)
+                status, body = request_runner("POST", "/run", payload)
+        except urllib.error.URLError as e:
+            raise SystemExit(f"ETL runner not reachable on port {RUNNER_PORT} ({e.reason}); "
+                             f"check the etl-runner service: docker-compose logs etl-runner")
+        print(json.dumps(body, indent=2, default=str))
+        if status != 200:
+            raise SystemExit(1)
@@ -0,0 +1,54 @@
+from pyspark.sql import SparkSession
+from contextlib import contextmanager
+import glob
+import os
+
+# Ambil konfigurasi MinIO dari environment variables
+minio_endpoint = os.getenv("MINIO_ENDPOINT", "http://minio:9000")
+minio_access_key = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
+minio_secret_key = os.getenv("MINIO_SECRET_KEY", "minioadmin")
+
+# Konektor S3A; di image Spark jar ini sudah dipasang di $SPARK_HOME/jars (lihat Dockerfile)
+S3A_PACKAGES = "org.apache.hadoop:hadoop-aws:3.3.4,com.amazonaws:aws-java-sdk-bundle:1.12.262"
+
+def s3a_jars_available():
+    """True jika hadoop-aws sudah ada di classpath Spark (tidak perlu resolve Maven/Ivy saat startup)"""
+    jars_dir = os.path.join(os.getenv("SPARK_HOME", "/opt/bitnami/spark"), "jars")
+    return bool(glob.glob(os.path.join(jars_dir, "hadoop-aws-*.jar")))
+
+def create_spark_session(app_name):
+    """SparkSession dengan konfigurasi S3A untuk MinIO (dipakai ETL, batch scoring, dan runner)"""
+    builder = SparkSession.builder \
+        .appName(app_name) \
+        .config("spark.sql.adaptive.enabled", "true") \
+        .config("spark.sql.adaptive.coalescePartitions.enabled", "true") \
+        .config("spark.hadoop.fs.s3a.endpoint", minio_endpoint) \
+        .config("spark.hadoop.fs.s3a.access.key", minio_access_key) \
+        .config("spark.hadoop.fs.s3a.secret.key", minio_secret_key) \
+        .config("spark.hadoop.fs.s3a.path.style.access", "true") \
+        .config("spark.hadoop.fs.s3a.impl", "org.apache.hadoop.fs.s3a.S3AFileSystem")
+    if not s3a_jars_available():
+        # Fallback di luar image: unduh konektor lewat Ivy (lambat, butuh jaringan)
+        builder = builder.config("spark.jars.packages", S3A_PACKAGES)
+    return builder.getOrCreate()
+
+def warm_up_s3a(spark, uri="s3a://raw/"):
+    """Inisialisasi S3AFileSystem (client AWS, thread pool, koneksi) sebelum job pertama"""
+    jvm = spark.sparkContext._jvm
+    path = jvm.org.apache.hadoop.fs.Path(uri)
+    path.getFileSystem(spark.sparkContext._jsc.hadoopConfiguration()).exists(path)
+
+@contextmanager
+def session_conf(spark, overrides):
+    """Set konfigurasi SQL runtime selama satu job, lalu kembalikan nilai lama (session runner dipakai ulang)"""
+    previous = {key: spark.conf.get(key, None) for key in overrides}
+    for key, value in overrides.items():
+        spark.conf.set(key, value)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                spark.conf.unset(key)
+            else:
+                spark.conf.set(key, value)
@@ -7,6 +7,14 @@ from watchdog.observers.polling import PollingObserver # Impor PollingObserver
 from watchdog.events import FileSystemEventHandler
 import logging
 import shutil
+import json
+import tempfile
+import threading
+from datetime import datetime, timezone
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+import image_index
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
 
@@ -21,6 +29,90 @@ PATH_TO_MONITOR_INSIDE_CONTAINER = os.path.join(HOST_DATA_ROOT_IN_CONTAINER, SUB
 
 SUPPORTED_EXTENSIONS = ('.csv', '.jpg', '.jpeg', '.png', '.gif', '.parquet', '.json')
 
+# Landing transform: CSV -> Parquet (bertipe & terkompresi) di prefix paralel, mis.
+# raw/olist_orders_dataset.csv -> raw/parquet/olist_orders_dataset.parquet (+ .schema.json)
+PARQUET_LANDING_ENABLED = os.getenv("PARQUET_LANDING_ENABLED", "false").lower() in ("1", "true", "yes")
+PARQUET_LANDING_PREFIX = os.getenv("PARQUET_LANDING_PREFIX", "parquet")
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+PARQUET_CSV_BLOCK_SIZE = int(os.getenv("PARQUET_CSV_BLOCK_SIZE", str(8 * 1024 * 1024)))  # byte per chunk CSV
+
+# Index fingerprint gambar (dHash + vektor warna/layout) di lake untuk dedupe & produk serupa
+IMAGE_INDEX_ENABLED = os.getenv("IMAGE_INDEX_ENABLED", "false").lower() in ("1", "true", "yes")
+IMAGE_INDEX_BUCKET = os.getenv("IMAGE_INDEX_BUCKET", "gold")
+IMAGE_INDEX_PREFIX = os.getenv("IMAGE_INDEX_PREFIX", "image_fingerprints/")
+IMAGE_INDEX_WORKERS = int(os.getenv("IMAGE_INDEX_WORKERS", "0")) or None  # default: jumlah CPU
+IMAGE_INDEX_COMPACT_PARTS = int(os.getenv("IMAGE_INDEX_COMPACT_PARTS", "20"))  # gabung part kecil setelah N part
+
+# Skema eksplisit per tabel Olist yang didukung (tanpa inferensi skema)
+LANDING_SCHEMAS = {
+    "olist_orders_dataset.csv": {
+        "order_id": pa.string(),
+        "customer_id": pa.string(),
+        "order_status": pa.string(),
+        "order_purchase_timestamp": pa.timestamp("s"),
+        "order_approved_at": pa.timestamp("s"),
+        "order_delivered_carrier_date": pa.timestamp("s"),
+        "order_delivered_customer_date": pa.timestamp("s"),
+        "order_estimated_delivery_date": pa.timestamp("s"),
+    },
+    "olist_order_items_dataset.csv": {
+        "order_id": pa.string(),
+        "order_item_id": pa.int32(),
+        "product_id": pa.string(),
+        "seller_id": pa.string(),
+        "shipping_limit_date": pa.timestamp("s"),
+        "price": pa.float64(),
+        "freight_value": pa.float64(),
+    },
+    "olist_products_dataset.csv": {
+        "product_id": pa.string(),
+        "product_category_name": pa.string(),
+        "product_name_lenght": pa.int32(),
+        "product_description_lenght": pa.int32(),
+        "product_photos_qty": pa.int32(),
+        "product_weight_g": pa.int32(),
+        "product_length_cm": pa.int32(),
+        "product_height_cm": pa.int32(),
+        "product_width_cm": pa.int32(),
+    },
+    "olist_order_reviews_dataset.csv": {
+        "review_id": pa.string(),
+        "order_id": pa.string(),
+        "review_score": pa.int32(),
+        "review_comment_title": pa.string(),
+        "review_comment_message": pa.string(),
+        "review_creation_date": pa.timestamp("s"),
+        "review_answer_timestamp": pa.timestamp("s"),
+    },
+    "olist_order_payments_dataset.csv": {
+        "order_id": pa.string(),
+        "payment_sequential": pa.int32(),
+        "payment_type": pa.string(),
+        "payment_installments": pa.int32(),
+        "payment_value": pa.float64(),
+    },
+    "olist_customers_dataset.csv": {
+        "customer_id": pa.string(),
+        "customer_unique_id": pa.string(),
+        "customer_zip_code_prefix": pa.int32(),
+        "customer_city": pa.string(),
+        "customer_state": pa.string(),
+    },
+    "olist_sellers_dataset.csv": {
+        "seller_id": pa.string(),
+        "seller_zip_code_prefix": pa.int32(),
+        "seller_city": pa.string(),
+        "seller_state": pa.string(),
+    },
+    "olist_geolocation_dataset.csv": {
+        "geolocation_zip_code_prefix": pa.int32(),
+        "geolocation_lat": pa.float64(),
+        "geolocation_lng": pa.float64(),
+        "geolocation_city": pa.string(),
+        "geolocation_state": pa.string(),
+    },
+}
+
 try:
     s3_client = boto3.client(
         's3',
@@ -39,6 +131,10 @@ class FileChangeHandler(FileSystemEventHandler):
     def __init__(self, monitored_base_path, target_bucket):
         self.monitored_base_path = monitored_base_path
         self.target_bucket = target_bucket
+        self.image_index = None
+        self.pending_image_records = []
+        self.image_index_parts = []
+        self.image_index_lock = threading.Lock()
         super().__init__()
 
     def _should_process(self, src_path):
@@ -77,6 +173,8 @@ class FileChangeHandler(FileSystemEventHandler):
             logging.info(f"Attempting to upload {file_path} to MinIO bucket '{self.target_bucket}' as '{s3_object_name}'...")
             s3_client.upload_file(file_path, self.target_bucket, s3_object_name)
             logging.info(f"Successfully uploaded {s3_object_name} to {self.target_bucket}/{s3_object_name}")
+            self.land_as_parquet(file_path, s3_object_name)
+            self.index_uploaded_image(file_path, s3_object_name)
             # Opsional: Pindahkan file setelah upload
             # processed_dir = os.path.join(os.path.dirname(file_path), "processed_by_streamer")
             # os.makedirs(processed_dir, exist_ok=True)
@@ -87,6 +185,171 @@ class FileChangeHandler(FileSystemEventHandler):
         except Exception as e:
             logging.error(f"Failed to upload {file_path} to MinIO: {e}")
 
+    def land_as_parquet(self, file_path, s3_object_name):
+        """Konversi CSV yang didukung ke Parquet per chunk dan upload beserta sidecar skema."""
+        if not PARQUET_LANDING_ENABLED:
+            return
+        column_types = LANDING_SCHEMAS.get(os.path.basename(file_path))
+        if column_types is None:
+            return
+
+        base_key = f"{PARQUET_LANDING_PREFIX}/{os.path.splitext(s3_object_name)[0]}"
+        parquet_key = f"{base_key}.parquet"
+        sidecar_key = f"{base_key}.schema.json"
+
+        tmp = tempfile.NamedTemporaryFile(suffix=".parquet", delete=False)
+        tmp.close()
+        try:
+            reader = pa_csv.open_csv(
+                file_path,
+                read_options=pa_csv.ReadOptions(block_size=PARQUET_CSV_BLOCK_SIZE),
+                parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+                # Samakan dengan reader CSV Spark (fallback di etl_pipeline.py): hanya field kosong
+                # tanpa kutip yang menjadi null, termasuk untuk kolom string
+                convert_options=pa_csv.ConvertOptions(
+                    column_types=column_types,
+                    null_values=[""],
+                    strings_can_be_null=True,
+                    quoted_strings_can_be_null=False,
+                ),
+            )
+            rows = 0
+            # Hanya satu batch yang berada di memori pada satu waktu
+            with pq.ParquetWriter(tmp.name, reader.schema, compression=PARQUET_COMPRESSION) as writer:
+                for batch in reader:
+                    writer.write_batch(batch)
+                    rows += batch.num_rows
+
+            s3_client.upload_file(tmp.name, self.target_bucket, parquet_key)
+            sidecar = {
+                "source_key": s3_object_name,
+                "parquet_key": parquet_key,
+                "row_count": rows,
+                "columns": [{"name": field.name, "type": str(field.type)} for field in reader.schema],
+                "compression": PARQUET_COMPRESSION,
+                "source_bytes": os.path.getsize(file_path),
+                "parquet_bytes": os.path.getsize(tmp.name),
+                "converted_at": datetime.now(timezone.utc).isoformat(),
+            }
+            s3_client.put_object(
+                Bucket=self.target_bucket,
+                Key=sidecar_key,
+                Body=json.dumps(sidecar, indent=2).encode("utf-8"),
+                ContentType="application/json",
+            )
+            logging.info(
+                f"Parquet landing: {s3_object_name} -> {self.target_bucket}/{parquet_key} "
+                f"({rows} rows, {sidecar['source_bytes']} -> {sidecar['parquet_bytes']} bytes)"
+            )
+        except Exception as e:
+            logging.error(f"Parquet landing failed for {file_path}: {e}")
+            self.remove_stale_parquet(parquet_key, sidecar_key)
+        finally:
+            os.remove(tmp.name)
+
+    def remove_stale_parquet(self, parquet_key, sidecar_key):
+        """Hapus Parquet lama agar ETL kembali membaca CSV terbaru, bukan hasil landing yang basi."""
+        try:
+            s3_client.delete_objects(Bucket=self.target_bucket, Delete={
+                "Objects": [{"Key": parquet_key}, {"Key": sidecar_key}], "Quiet": True
+            })
+            logging.warning(f"Parquet landing: removed stale {self.target_bucket}/{parquet_key}; ETL will fall back to CSV")
+        except Exception as e:
+            logging.error(f"Parquet landing: failed to remove stale {self.target_bucket}/{parquet_key}: {e}")
+
+    def build_image_index_incremental(self):
+        """Load index gambar dari lake, lalu fingerprint (paralel) hanya gambar yang belum terindeks."""
+        if not IMAGE_INDEX_ENABLED:
+            return
+        try:
+            table, self.image_index_parts = image_index.read_index_table(s3_client, IMAGE_INDEX_BUCKET, IMAGE_INDEX_PREFIX)
+            self.image_index = image_index.ImageIndex.from_table(table)
+            logging.info(f"Image index: loaded {len(self.image_index)} fingerprints from {len(self.image_index_parts)} parts "
+                         f"in {IMAGE_INDEX_BUCKET}/{IMAGE_INDEX_PREFIX}")
+            self.compact_image_index(table)
+        except Exception as e:
+            logging.error(f"Image index: failed to load existing fingerprints, starting empty: {e}")
+            self.image_index = image_index.ImageIndex()
+
+        # Gambar baru atau yang berubah sejak di-fingerprint (mtime berbeda)
+        new_images = [
+            (path, key) for path, key, mtime_ns in image_index.list_local_images(self.monitored_base_path)
+            if not self.image_index.is_current(key, mtime_ns)
+        ]
+        if not new_images:
+            logging.info("Image index: no new or changed images to fingerprint")
+            return
+
+        start = time.perf_counter()
+        records = image_index.fingerprint_files(new_images, max_workers=IMAGE_INDEX_WORKERS)
+        elapsed = time.perf_counter() - start
+        with self.image_index_lock:
+            records = image_index.dedupe_and_add(self.image_index, records)
+        duplicates = sum(1 for r in records if r["duplicate_of"])
+        try:
+            part_key = image_index.write_index_part(s3_client, IMAGE_INDEX_BUCKET, IMAGE_INDEX_PREFIX, records)
+            if part_key:
+                self.image_index_parts.append(part_key)
+            logging.info(
+                f"Image index: fingerprinted {len(records)} new/changed images in {elapsed:.1f}s "
+                f"({len(records) / max(elapsed, 1e-9):.0f} images/s), {duplicates} duplicates, saved as {part_key}"
+            )
+        except Exception as e:
+            logging.error(f"Image index: failed to write fingerprints to lake: {e}")
+
+    def index_uploaded_image(self, file_path, s3_object_name):
+        """Fingerprint satu gambar baru saat ingest dan cek duplikat terhadap index di memori."""
+        if not IMAGE_INDEX_ENABLED or self.image_index is None:
+            return
+        if not file_path.lower().endswith(image_index.IMAGE_EXTENSIONS):
+            return
+        if self.image_index.is_current(s3_object_name, os.stat(file_path).st_mtime_ns):
+            return
+        record = image_index.fingerprint_file((file_path, s3_object_name))
+        if record is None:
+            return
+        with self.image_index_lock:
+            self.pending_image_records.extend(image_index.dedupe_and_add(self.image_index, [record]))
+
+    def flush_image_index(self):
+        """Simpan fingerprint yang tertunda sebagai part parquet baru."""
+        with self.image_index_lock:
+            records, self.pending_image_records = self.pending_image_records, []
+        if not records:
+            return
+        try:
+            part_key = image_index.write_index_part(s3_client, IMAGE_INDEX_BUCKET, IMAGE_INDEX_PREFIX, records)
+            self.image_index_parts.append(part_key)
+            duplicates = sum(1 for r in records if r["duplicate_of"])
+            logging.info(f"Image index: saved {len(records)} new fingerprints ({duplicates} duplicates) as {part_key}")
+        except Exception as e:
+            logging.error(f"Image index: failed to write fingerprints to lake: {e}")
+            with self.image_index_lock:
+                self.pending_image_records = records + self.pending_image_records
+            return
+        if len(self.image_index_parts) >= IMAGE_INDEX_COMPACT_PARTS:
+            self.compact_image_index()
+
+    def compact_image_index(self, table=None):
+        """Gabungkan part parquet kecil (satu baris per gambar, fingerprint terbaru).
+
+        Saat startup `table` berisi seluruh index -> semua part jadi satu. Saat berjalan hanya
+        part kecil setelah part dasar yang digabung, agar tidak membaca ulang seluruh index.
+        """
+        base_parts = [] if table is not None else self.image_index_parts[:1]
+        parts = self.image_index_parts[len(base_parts):]
+        if len(parts) <= 1:
+            return
+        try:
+            if table is None:
+                table, _ = image_index.read_index_table(s3_client, IMAGE_INDEX_BUCKET, IMAGE_INDEX_PREFIX, parts)
+            part_key = image_index.compact_index(s3_client, IMAGE_INDEX_BUCKET, IMAGE_INDEX_PREFIX, table, parts)
+            if part_key:
+                self.image_index_parts = base_parts + [part_key]
+                logging.info(f"Image index: compacted {len(parts)} parts into {part_key} ({table.num_rows} fingerprints)")
+        except Exception as e:
+            logging.error(f"Image index: compaction failed, keeping existing parts: {e}")
+
     # Jadikan initial_scan_and_upload sebagai method dari class ini
     def initial_scan_and_upload(self):
         """Scan direktori yang dipantau dan upload hanya ke bucket target."""
@@ -114,6 +377,7 @@ class FileChangeHandler(FileSystemEventHandler):
                     logging.info(f"Initial scan: Uploading {file_path} to bucket '{self.target_bucket}' as '{s3_object_name}'")
                     s3_client.upload_file(file_path, self.target_bucket, s3_object_name)
                     logging.info(f"Initial scan: Uploaded {s3_object_name} to {self.target_bucket}/{s3_object_name}")
+                    self.land_as_parquet(file_path, s3_object_name)
                 except Exception as e:
                     logging.error(f"Initial scan: Failed to upload {file_path} to bucket {self.target_bucket}: {e}")
 
@@ -122,6 +386,8 @@ if __name__ == "__main__":
     logging.info(f"Script starting. SUBDIR_TO_MONITOR: {SUBDIR_TO_MONITOR}")
     logging.info(f"Script starting. Final PATH_TO_MONITOR_INSIDE_CONTAINER: {PATH_TO_MONITOR_INSIDE_CONTAINER}")
     logging.info(f"Script starting. Target MinIO Bucket: {MINIO_RAW_BUCKET}")
+    logging.info(f"Script starting. Image fingerprint index enabled: {IMAGE_INDEX_ENABLED} ({IMAGE_INDEX_BUCKET}/{IMAGE_INDEX_PREFIX})")
+    logging.info(f"Script starting. Parquet landing enabled: {PARQUET_LANDING_ENABLED} (prefix '{PARQUET_LANDING_PREFIX}/')")
     
     if s3_client is None:
         logging.error("Exiting script: MinIO connection could not be established.")
@@ -142,6 +408,7 @@ if __name__ == "__main__":
     )
 
     event_handler.initial_scan_and_upload()
+    event_handler.build_image_index_incremental()
 
     observer = PollingObserver()
     observer.schedule(event_handler, PATH_TO_MONITOR_INSIDE_CONTAINER, recursive=True)
@@ -151,6 +418,7 @@ if __name__ == "__main__":
     try:
         while True:
             time.sleep(5)
+            event_handler.flush_image_index()
     except KeyboardInterrupt:
         logging.info("Keyboard interrupt received, stopping observer...")
     except Exception as e:
@@ -5,7 +5,7 @@ import pandas as pd
 import os
 import boto3
 import random
-import io
+import image_index
 # from PIL import Image # Opsional, jika ingin resize dengan Pillow
 
 st.set_page_config(
@@ -20,6 +20,8 @@ MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
 MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY", "minioadmin")
 MINIO_RAW_BUCKET_NAME = os.getenv("MINIO_RAW_BUCKET_NAME", "raw")
 IMAGE_BASE_PATH_IN_BUCKET = "images/"
+IMAGE_INDEX_BUCKET = os.getenv("IMAGE_INDEX_BUCKET", "gold")
+IMAGE_INDEX_PREFIX = os.getenv("IMAGE_INDEX_PREFIX", "image_fingerprints/")
 
 @st.cache_resource
 def get_s3_client():
@@ -77,6 +79,25 @@ def get_random_images_data(image_keys_list, num_images=3):
             print(f"Error fetching image data for {key}: {e}")
     return selected_images_data
 
+@st.cache_resource(ttl=600)
+def load_image_index(_s3_client_placeholder):
+    """Index fingerprint gambar dari streamer (gold/image_fingerprints), lihat docker/common/image_index.py"""
+    if not s3_client:
+        return None
+    try:
+        index = image_index.load_index(s3_client, IMAGE_INDEX_BUCKET, IMAGE_INDEX_PREFIX)
+    except Exception as e:
+        print(f"Error loading image index: {e}")
+        return None
+    return index if len(index) else None
+
+def get_image_data(key):
+    try:
+        return s3_client.get_object(Bucket=MINIO_RAW_BUCKET_NAME, Key=key)['Body'].read()
+    except Exception as e:
+        print(f"Error fetching image data for {key}: {e}")
+        return None
+
 # --- End of MinIO Helper ---
 
 
@@ -110,7 +131,6 @@ else:
     st.sidebar.error(f"⚠️ MinIO Client Connection Failed. Ads disabled.")
 # --- End of Display Random Ad Images ---
 
-
 st.title("🛒 Olist E-commerce Price Predictor")
 st.markdown("### Predict product prices based on cost, freight, delivery time, and customer reviews")
 
@@ -174,6 +194,22 @@ with input_col:
             format="%.1f",
             help="Anticipated customer satisfaction score (1-5)."
         )
+
+        zip_col1, zip_col2 = st.columns(2)
+        with zip_col1:
+            seller_zip = st.text_input(
+                "Seller ZIP Prefix (optional)",
+                value="",
+                max_chars=5,
+                help="First 5 digits of the seller's CEP, used to estimate shipping distance."
+            )
+        with zip_col2:
+            customer_zip = st.text_input(
+                "Customer ZIP Prefix (optional)",
+                value="",
+                max_chars=5,
+                help="First 5 digits of the customer's CEP, used to estimate shipping distance."
+            )
         
         submit_button = st.form_submit_button("🔮 Predict Selling Price", use_container_width=True)
 
@@ -212,13 +248,24 @@ if submit_button:
                 "delivery_days": float(delivery_days),
                 "review_score": float(review_score) 
             }
-            response = requests.post("http://fastapi:8000/predict", json=payload)
+            if seller_zip.strip().isdigit() and customer_zip.strip().isdigit():
+                payload["seller_zip_code_prefix"] = int(seller_zip)
+                payload["customer_zip_code_prefix"] = int(customer_zip)
+            response = requests.post("http://fastapi:8000/predict", params={"interval": "true"}, json=payload)
+            if response.status_code == 503:
+                # Model tanpa dukungan interval: fallback ke prediksi titik saja
+                response = requests.post("http://fastapi:8000/predict", json=payload)
             
             if response.status_code == 200:
                 result = response.json()
                 predicted_price = result["predicted_price"]
                 
                 st.success("🎯 Prediction Complete!")
+                distance_km = result.get("input_features", {}).get("distance_km")
+                if result.get("input_features", {}).get("distance_km_imputed"):
+                    st.caption(f"📍 ZIP prefixes missing or unknown: using typical distance of {distance_km:.0f} km")
+                elif distance_km is not None:
+                    st.caption(f"📍 Estimated seller → customer distance: {distance_km:.0f} km")
                 
                 res_col1, res_col2, res_col3 = st.columns(3)
                 
@@ -240,6 +287,14 @@ if submit_button:
                         delta_color="normal" if profit_value == 0 else ("inverse" if profit_value < 0 else "normal"),
                         help="Predicted Selling Price - Cost Price - Freight Value."
                     )
+                    interval = result.get("prediction_interval")
+                    if interval:
+                        profit_low = interval["p10"] - cost_price - freight_value
+                        profit_high = interval["p90"] - cost_price - freight_value
+                        st.caption(
+                            f"📉📈 Likely profit range (p10–p90): R$ {profit_low:.2f} – R$ {profit_high:.2f} "
+                            f"(selling price R$ {interval['p10']:.2f} – R$ {interval['p90']:.2f})"
+                        )
                 
                 with res_col3:
                     price_per_day = predicted_price / max(float(delivery_days), 1.0) 
@@ -298,6 +353,30 @@ if submit_button:
             import traceback
             st.text(traceback.format_exc())
 
+# --- Similar Products (image fingerprint index) ---
+similar_index = load_image_index(str(s3_client)) if s3_client else None
+if similar_index:
+    st.markdown("---")
+    with st.expander("🔍 Find Visually Similar Products"):
+        n_duplicates = sum(1 for d in similar_index.duplicate_of if d)
+        st.caption(f"{len(similar_index)} images indexed, {n_duplicates} flagged as duplicates")
+        category_options = sorted({c for c in similar_index.categories if c})
+        selected_category = st.selectbox("Category", category_options)
+        category_keys = [k for k, c in zip(similar_index.keys, similar_index.categories) if c == selected_category]
+        selected_key = st.selectbox("Product image", category_keys, format_func=lambda k: k.split('/')[-1])
+        if selected_key:
+            query_col, *similar_cols = st.columns(5)
+            with query_col:
+                image_data = get_image_data(selected_key)
+                if image_data:
+                    st.image(image_data, width=IMAGE_DISPLAY_WIDTH // 2, caption="Selected")
+            for col, (key, score) in zip(similar_cols, similar_index.nearest(selected_key, k=4)):
+                with col:
+                    image_data = get_image_data(key)
+                    if image_data:
+                        st.image(image_data, width=IMAGE_DISPLAY_WIDTH // 2, caption=f"{key.split('/')[-2]} · {score:.2f}")
+# --- End of Similar Products ---
+
 st.markdown("---")
 st.header("ℹ️ About This Application & Model")
 